@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+Topic: 本章几个数据结构的性能测试
+Desc : 
+
+    python bench.py NAME [N]
+
+NAME 是 BENCHMARKS 中的一个，N 是规模，每个都和标准库的做法比较
+"""
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from p05_priority_queue import PriorityQueue, IndexedPriorityQueue
+from p12_mostfreq_items import HeavyHitters
+from p13_sort_dictlist import RecordBatch
+from p15_group import group_reduce
+
+
+def timed(name, func, count=None, unit='ops'):
+    """运行 func 并打印用时，给了 count 时再打印每秒处理多少个，返回 func 的结果"""
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    line = '{:<44} {:8.3f}s'.format(name, elapsed)
+    if count is not None:
+        line += ' {:>12,.0f} {}/s'.format(count / elapsed, unit)
+    print(line)
+    return result
+
+
+def priority_queue(ops=10 ** 6):
+    """push/pop 和 PriorityQueue 对比，再加上 update_priority/remove 的混合操作"""
+    rnd = random.Random(0)
+    priorities = [rnd.random() for _ in range(1000)]
+
+    def push_pop(q):
+        # 队列先涨到 ops/2 个元素，再全部取出
+        for i in range(ops // 2):
+            q.push(i, priorities[i % 1000])
+        for _ in range(ops // 2):
+            q.pop()
+
+    def mixed():
+        q = IndexedPriorityQueue()
+        rnd = random.Random(1)
+        q.push_many((i, rnd.random()) for i in range(1000))
+        n = 1000
+        for _ in range(ops - 1000):
+            r = rnd.random()
+            if r < 0.35 or not q:
+                q.push(n, r)
+                n += 1
+            elif r < 0.65:
+                q.pop()
+            else:
+                item = rnd.randrange(n)
+                if item not in q:
+                    q.push(item, r)
+                elif r < 0.9:
+                    q.update_priority(item, rnd.random())
+                else:
+                    q.remove(item)
+
+    timed('PriorityQueue push/pop', lambda: push_pop(PriorityQueue()), ops)
+    timed('IndexedPriorityQueue push/pop', lambda: push_pop(IndexedPriorityQueue()), ops)
+    timed('IndexedPriorityQueue push/pop/update/remove', mixed, ops)
+
+
+def mostfreq(tokens=10 ** 7, vocabulary=10 ** 6, capacity=10000):
+    """Zipf 分布的单词流，HeavyHitters 和 Counter 比较时间、内存和 top 100 的准确度"""
+    rnd = random.Random(0)
+    weights = [1 / i for i in range(1, vocabulary + 1)]
+    words = ['w%d' % i for i in range(vocabulary)]
+    stream = rnd.choices(words, weights, k=tokens)
+    print('{:,d} tokens, {:,d} distinct'.format(tokens, len(set(stream))))
+
+    results = []
+    for name, make in (('Counter', Counter), ('HeavyHitters(%d)' % capacity, lambda: HeavyHitters(capacity))):
+        counter = make()
+        timed(name, lambda: counter.update(stream), tokens, 'tokens')
+        # 计数对象本身占的内存，从已经汇总好的次数重建一个来量
+        tracemalloc.start()
+        copy = make()
+        copy.update(results[0] if results else counter)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del copy
+        results.append(counter)
+        print('{:<44} {:8.1f} MB'.format(name + ' size', size / 2 ** 20))
+    exact, approx = results
+    top = exact.most_common(100)
+    found = sum(1 for word, _ in approx.most_common(100) if word in dict(top))
+    worst = max(abs(approx[word] - n) / n for word, n in top)
+    print('top 100: {} found, worst relative error {:.4%}, error bound {:,d}'.format(
+        found, worst, approx.total // capacity))
+
+
+def sort_dictlist(n=10 ** 6):
+    """sorted(rows, key=itemgetter(...)) 和 RecordBatch 的比较"""
+    rnd = random.Random(0)
+    rows = [{'fname': 'f%d' % rnd.randrange(5000), 'lname': 'l%d' % rnd.randrange(5000),
+             'uid': rnd.randrange(10 ** 7)} for _ in range(n)]
+
+    batch = timed('RecordBatch.from_rows', lambda: RecordBatch.from_rows(rows))
+    for fields in (('uid',), ('lname', 'fname')):
+        expected = timed('sorted itemgetter%r' % (fields,), lambda: sorted(rows, key=itemgetter(*fields)))
+        result = timed('RecordBatch.sort_by%r' % (fields,), lambda: batch.sort_by(*fields))
+        assert result == expected
+
+
+def group(n=10 ** 6, groups=10 ** 5):
+    """sort + groupby 和 group_reduce 的比较，max_groups 小于分组数时要写临时文件"""
+    rnd = random.Random(0)
+    rows = [{'key': rnd.randrange(groups), 'amount': rnd.random()} for _ in range(n)]
+
+    def sort_groupby():
+        ordered = sorted(rows, key=itemgetter('key'))
+        return {k: sum(r['amount'] for r in g) for k, g in groupby(ordered, key=itemgetter('key'))}
+
+    expected = timed('sort + groupby', sort_groupby)
+    for max_groups in (groups, groups // 10):
+        result = timed('group_reduce(max_groups=%d)' % max_groups, lambda: dict(group_reduce(
+            rows, itemgetter('key'), 'sum', itemgetter('amount'), max_groups=max_groups)))
+        assert result == expected
+
+
+BENCHMARKS = {
+    'priority_queue': priority_queue,
+    'mostfreq': mostfreq,
+    'sort_dictlist': sort_dictlist,
+    'group': group,
+}
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    if not args or args[0] not in BENCHMARKS:
+        sys.exit('usage: python bench.py {%s} [N]' % '|'.join(BENCHMARKS))
+    BENCHMARKS[args[0]](*[int(n) for n in args[1:2]])
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,95 @@ Desc :
 """
 import heapq
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class _Reversed:
+    """比较结果相反，用最小堆保留最小的N个元素"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class TopN:
+    """
+    流式的 nlargest / nsmallest (smallest=True)，只保留一个大小为n的堆，
+    元素可以一个一个地 add() 或一批一批地 extend()，随时用 snapshot()
+    取得当前结果，和对所有加入过的元素调用 heapq.nlargest(n, items, key)
+    的结果一样 (包括相等元素之间的先后顺序)。
+
+    多个进程各自统计的结果可以 merge() 到一起，进程之间传递的是
+    snapshot() 的列表 (key 函数往往不能 pickle)。
+    """
+
+    def __init__(self, n, key=None, smallest=False):
+        self.n = n
+        self.key = key
+        self.smallest = smallest
+        # (rank, item) 的最小堆，堆顶是保留下来的元素里排名最低的
+        self._heap = []
+        self._index = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _rank(self, item):
+        k = item if self.key is None else self.key(item)
+        self._index += 1
+        # 相等的元素先加入的排前面，和 heapq.nlargest 一样
+        if self.smallest:
+            return _Reversed((k, self._index))
+        return k, -self._index
+
+    def add(self, item):
+        if self.n <= 0:
+            return
+        entry = (self._rank(item), item)
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, entry)
+        elif self._heap[0][0] < entry[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def extend(self, items):
+        """
+        一批元素只有其中前n名可能进入结果，先用 heapq 选出来，
+        numpy 的一维数值数组 (没有key时) 用 argpartition 选
+        """
+        if np is not None and self.key is None and isinstance(items, np.ndarray) and items.ndim == 1:
+            items = self._partition(items)
+        else:
+            items = (heapq.nsmallest if self.smallest else heapq.nlargest)(self.n, items, key=self.key)
+        for item in items:
+            self.add(item)
+
+    def _partition(self, items):
+        """数组中前n名的元素，保持在数组中的顺序"""
+        if len(items) <= self.n:
+            return items.tolist()
+        if self.n <= 0:
+            return []
+        kth = len(items) - self.n if not self.smallest else self.n - 1
+        pivot = items[np.argpartition(items, kth)[kth]]
+        better = items < pivot if self.smallest else items > pivot
+        # 和第n名相等的元素，取最前面的几个
+        ties = np.flatnonzero(items == pivot)[:self.n - int(better.sum())]
+        return items[np.sort(np.concatenate([np.flatnonzero(better), ties]))].tolist()
+
+    def merge(self, other):
+        """合并另一个 TopN 或它的 snapshot()，相等的元素排在已有元素之后"""
+        self.extend(other.snapshot() if isinstance(other, TopN) else other)
+
+    def snapshot(self):
+        """当前的前n名，从大到小 (smallest=True 时从小到大)"""
+        return [item for _, item in sorted(self._heap, reverse=True)]
+
 
 def main():
     portfolio = [
@@ -28,6 +117,23 @@ def main():
     print(heapq.heappop(nums))
     print(heapq.heappop(nums))
 
+    # 价格是源源不断到来的，只保留前3名
+    cheap = TopN(3, key=lambda s: s['price'], smallest=True)
+    expensive = TopN(3, key=lambda s: s['price'])
+    for s in portfolio:
+        cheap.add(s)
+        expensive.add(s)
+    print(cheap.snapshot())
+    print(expensive.snapshot())
+
+    # 两个 worker 各统计一半，再合并
+    top, other = TopN(3), TopN(3)
+    top.extend([1, 8, 2, 23, 7, -4])
+    other.extend([18, 23, 42, 37, 2])
+    top.merge(other.snapshot())
+    print(top.snapshot())
+    # Outputs [42, 37, 23]
+
 
 if __name__ == '__main__':
     main()
@@ -4,7 +4,10 @@
 Topic: 优先级队列
 Desc : 
 """
+import asyncio
 import heapq
+import queue
+import threading
 
 
 class PriorityQueue:
@@ -19,3 +22,248 @@ class PriorityQueue:
     def pop(self):
         return heapq.heappop(self._queue)[-1]
 
+
+class ThreadedPriorityQueue(PriorityQueue):
+    """
+    线程安全的 PriorityQueue，pop() 在队列为空时等待，
+    maxsize 大于0时 push() 在队列满时等待 (backpressure)。
+    等待超时分别抛出 queue.Empty 和 queue.Full。
+    """
+
+    def __init__(self, maxsize=0):
+        super().__init__()
+        self.maxsize = maxsize
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+
+    def __len__(self):
+        with self._mutex:
+            return len(self._queue)
+
+    def push(self, item, priority, timeout=None):
+        with self._not_full:
+            if self.maxsize > 0 and not self._not_full.wait_for(
+                    lambda: len(self._queue) < self.maxsize, timeout):
+                raise queue.Full
+            super().push(item, priority)
+            self._not_empty.notify()
+
+    def pop(self, timeout=None):
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._queue, timeout):
+                raise queue.Empty
+            item = super().pop()
+            self._not_full.notify()
+            return item
+
+
+class _HeapQueue(asyncio.Queue):
+    """按 (-priority, index, item) 出队的 asyncio.Queue，只在 AsyncPriorityQueue 内部用"""
+
+    def _init(self, maxsize):
+        self._queue = []
+
+    def _put(self, entry):
+        heapq.heappush(self._queue, entry)
+
+    def _get(self):
+        return heapq.heappop(self._queue)[-1]
+
+
+class AsyncPriorityQueue:
+    """
+    asyncio 版本的 PriorityQueue: await push() / await pop()
+    等待的方式和 asyncio.Queue 一样，只是按优先级出队，
+    优先级相同的按 push() 调用的顺序。
+    队列包在里面而不是继承 asyncio.Queue，这样就没有 put() 之类
+    不带优先级的方法能把元素直接放进堆里。
+    """
+
+    def __init__(self, maxsize=0):
+        self._queue = _HeapQueue(maxsize)
+        self._index = 0
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def empty(self):
+        return self._queue.empty()
+
+    def full(self):
+        return self._queue.full()
+
+    def _entry(self, item, priority):
+        entry = (-priority, self._index, item)
+        self._index += 1
+        return entry
+
+    async def push(self, item, priority):
+        # 序号在等待之前分配，队列满时先调用的先入队
+        await self._queue.put(self._entry(item, priority))
+
+    def push_nowait(self, item, priority):
+        """队列满时抛出 asyncio.QueueFull"""
+        self._queue.put_nowait(self._entry(item, priority))
+
+    async def pop(self, timeout=None):
+        """超时抛出 asyncio.TimeoutError"""
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    def pop_nowait(self):
+        """队列为空时抛出 asyncio.QueueEmpty"""
+        return self._queue.get_nowait()
+
+
+class IndexedPriorityQueue:
+    """
+    可以修改优先级、删除任意元素的优先级队列 (indexed heap)
+
+    元素必须是hashable的，同一个元素在队列中只能有一个。堆保存在三个平行的
+    列表里 (取负的优先级、入队序号、元素)，不用为每个元素创建元组，另有一个
+    字典记录每个元素在堆中的位置，所以 update_priority() 和 remove() 都是
+    O(log n)。优先级相同的元素按入队顺序出队，和 PriorityQueue 一样，
+    修改优先级不改变元素的入队序号。
+    """
+
+    def __init__(self):
+        self._prio = []
+        self._seq = []
+        self._items = []
+        self._pos = {}
+        self._index = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._pos
+
+    def push(self, item, priority):
+        if item in self._pos:
+            raise ValueError('{!r} is already queued'.format(item))
+        self._append(item, priority)
+        self._sift_up(len(self._items) - 1)
+
+    def push_many(self, pairs):
+        """一次加入多个 (item, priority)，最后用 heapify 建堆，O(n)"""
+        pairs = list(pairs)
+        seen = set()
+        for item, _ in pairs:
+            if item in self._pos or item in seen:
+                raise ValueError('{!r} is already queued'.format(item))
+            seen.add(item)
+        for item, priority in pairs:
+            self._append(item, priority)
+        for i in reversed(range(len(self._items) // 2)):
+            self._sift_down(i)
+
+    def peek(self):
+        return self._items[0]
+
+    def pop(self):
+        item = self._items[0]
+        self._take(0)
+        return item
+
+    def remove(self, item):
+        self._take(self._pos[item])
+
+    def update_priority(self, item, priority):
+        i = self._pos[item]
+        self._prio[i] = -priority
+        self._fix(i)
+
+    def _append(self, item, priority):
+        self._pos[item] = len(self._items)
+        self._prio.append(-priority)
+        self._seq.append(self._index)
+        self._items.append(item)
+        self._index += 1
+
+    def _take(self, i):
+        """删除位置i上的元素，用最后一个元素填补"""
+        del self._pos[self._items[i]]
+        prio, seq, item = self._prio.pop(), self._seq.pop(), self._items.pop()
+        if i < len(self._items):
+            self._prio[i], self._seq[i], self._items[i] = prio, seq, item
+            self._pos[item] = i
+            self._fix(i)
+
+    def _fix(self, i):
+        parent = (i - 1) >> 1
+        if i > 0 and (self._prio[i], self._seq[i]) < (self._prio[parent], self._seq[parent]):
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def _sift_up(self, i):
+        prio, seq, items, pos = self._prio, self._seq, self._items, self._pos
+        p, s, item = prio[i], seq[i], items[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            pp = prio[parent]
+            if p < pp or (p == pp and s < seq[parent]):
+                prio[i], seq[i], items[i] = pp, seq[parent], items[parent]
+                pos[items[i]] = i
+                i = parent
+            else:
+                break
+        prio[i], seq[i], items[i] = p, s, item
+        pos[item] = i
+
+    def _sift_down(self, i):
+        prio, seq, items, pos = self._prio, self._seq, self._items, self._pos
+        n = len(items)
+        p, s, item = prio[i], seq[i], items[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            right = child + 1
+            if right < n and (prio[right] < prio[child] or
+                              (prio[right] == prio[child] and seq[right] < seq[child])):
+                child = right
+            cp = prio[child]
+            if cp < p or (cp == p and seq[child] < s):
+                prio[i], seq[i], items[i] = cp, seq[child], items[child]
+                pos[items[i]] = i
+                i = child
+            else:
+                break
+        prio[i], seq[i], items[i] = p, s, item
+        pos[item] = i
+
+
+def main():
+    q = IndexedPriorityQueue()
+    q.push_many([('foo', 1), ('bar', 5), ('spam', 4), ('grok', 1)])
+    q.update_priority('foo', 6)
+    q.remove('spam')
+    print(q.peek())
+    print([q.pop() for _ in range(len(q))])
+    # Outputs ['foo', 'bar', 'grok']
+
+    q = ThreadedPriorityQueue(maxsize=2)
+    q.push('foo', 1)
+    q.push('bar', 5)
+    # 队列已满，另一个线程取走 'bar' 之后 push() 才返回
+    taken = []
+    consumer = threading.Timer(0.1, lambda: taken.append(q.pop()))
+    consumer.start()
+    q.push('spam', 4)
+    consumer.join()
+    print(taken, q.pop(), q.pop(timeout=1))
+    # Outputs ['bar'] spam foo
+
+    async def produce_consume():
+        q = AsyncPriorityQueue()
+        for item, priority in [('foo', 1), ('bar', 5), ('spam', 4), ('grok', 1)]:
+            await q.push(item, priority)
+        return [await q.pop() for _ in range(4)]
+    print(asyncio.run(produce_consume()))
+    # Outputs ['bar', 'spam', 'foo', 'grok']
+
+
+if __name__ == '__main__':
+    main()
@@ -4,20 +4,27 @@
 Topic: 消除序列重复值并保持顺序
 Desc : 
 """
+import hashlib
+import math
+import os
+import pickle
+import sqlite3
+import tempfile
+from collections import deque
 
 
-def dedupe(items):
+def dedupe(items, seen=None):
     """元素都是hashable"""
-    seen = set()
+    seen = set() if seen is None else seen
     for item in items:
         if item not in seen:
             yield item
             seen.add(item)
 
 
-def dedupe2(items, key=None):
+def dedupe2(items, key=None, seen=None):
     """元素不是hashable的时候"""
-    seen = set()
+    seen = set() if seen is None else seen
     for item in items:
         val = item if key is None else key(item)
         if val not in seen:
@@ -25,6 +32,123 @@ def dedupe2(items, key=None):
             seen.add(val)
 
 
+# 元素太多、set 放不下的时候，seen 可以换成下面的对象
+
+
+class BloomFilter:
+    """
+    布隆过滤器，内存固定为约 -capacity * ln(error_rate) / ln(2)**2 个bit，
+    加入不超过 capacity 个元素时，一个没加入过的元素被误判为已存在的概率
+    不超过 error_rate，用作 seen 时这些元素会被当成重复值丢掉，
+    已加入的元素则一定能判断出来。
+    元素用 pickle 序列化后计算哈希，和 SpillSet 一样，相等的元素
+    pickle 出来也要一样，好处是不同进程算出的位置相同，可以共用或保存。
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        self.size = max(1, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # 两个哈希值组合出 hashes 个位置 (Kirsch-Mitzenmacher)
+        digest = hashlib.blake2b(pickle.dumps(item, protocol=4), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def __contains__(self, item):
+        bits = self._bits
+        for p in self._positions(item):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def add(self, item):
+        bits = self._bits
+        for p in self._positions(item):
+            bits[p >> 3] |= 1 << (p & 7)
+
+
+class SpillSet:
+    """
+    精确的 seen 集合，元素超过 max_items 个之后转存到 sqlite 文件里，
+    内存中只保留最近加入的不超过 max_items 个。
+    元素用 pickle 序列化后比较，相等的元素 pickle 出来也要一样
+    (str、bytes、int 以及它们组成的 tuple 都可以)。
+    """
+
+    def __init__(self, max_items=1000000, path=None):
+        self.max_items = max_items
+        self._recent = set()
+        self._db = None
+        self._path = path
+        self._temp = path is None
+
+    def __contains__(self, item):
+        if item in self._recent:
+            return True
+        if self._db is None:
+            return False
+        return self._db.execute('SELECT 1 FROM seen WHERE key = ?', (self._key(item),)).fetchone() is not None
+
+    def add(self, item):
+        self._recent.add(item)
+        if len(self._recent) > self.max_items:
+            self._spill()
+
+    @staticmethod
+    def _key(item):
+        return pickle.dumps(item, protocol=4)
+
+    def _spill(self):
+        if self._db is None:
+            if self._temp:
+                fd, self._path = tempfile.mkstemp(suffix='.sqlite')
+                os.close(fd)
+            self._db = sqlite3.connect(self._path)
+            self._db.execute('CREATE TABLE IF NOT EXISTS seen (key BLOB PRIMARY KEY) WITHOUT ROWID')
+        with self._db:
+            self._db.executemany('INSERT OR IGNORE INTO seen VALUES (?)',
+                                 ((self._key(item),) for item in self._recent))
+        self._recent.clear()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            if self._temp:
+                os.remove(self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def dedupe_window(items, size, key=None):
+    """只消除最近 size 个元素之内的重复值，内存只和 size 有关"""
+    window = deque()
+    counts = {}
+    for item in items:
+        val = item if key is None else key(item)
+        if val not in counts:
+            yield item
+        counts[val] = counts.get(val, 0) + 1
+        window.append(val)
+        if len(window) > size:
+            old = window.popleft()
+            counts[old] -= 1
+            if not counts[old]:
+                del counts[old]
+
+
 def remove_dup():
     a = [1, 5, 2, 1, 9, 1, 5, 10]
     print(list(dedupe(a)))
@@ -33,6 +157,13 @@ def remove_dup():
     print(list(dedupe2(a, key=lambda d: (d['x'], d['y']))))
     print(list(dedupe2(a, key=lambda d: d['x'])))
 
+    a = [1, 5, 2, 1, 9, 1, 5, 10]
+    print(list(dedupe(a, seen=BloomFilter(capacity=1000, error_rate=0.001))))
+    with SpillSet(max_items=2) as seen:
+        print(list(dedupe(a, seen=seen)))
+    print(list(dedupe_window(a, 2)))
+    # Outputs [1, 5, 2, 1, 9, 5, 10]
+
 
 if __name__ == '__main__':
     remove_dup()
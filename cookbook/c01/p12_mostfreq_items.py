@@ -4,6 +4,128 @@
 Topic: 查找出现次数最多的元素
 Desc : 
 """
+import heapq
+from collections import Counter
+from itertools import count, islice
+from operator import itemgetter
+
+
+class HeavyHitters:
+    """
+    近似的 Counter (Space-Saving 算法)，最多只记 capacity 个元素的次数，
+    内存和不同元素的个数无关。
+
+    记录满了之后，新元素替换掉次数最少的那个，并继承它的次数，
+    所以记下来的次数只会多不会少，多出的部分不超过 error(item)，
+    error(item) 又不超过 total / capacity。真实次数超过
+    total / capacity 的元素一定在记录中。
+
+    用法和 Counter 一样: update()、c[item]、most_common(k)，
+    不同进程各自统计的结果可以 merge() 到一起。
+    """
+
+    def __init__(self, capacity=1000, iterable=None):
+        self.capacity = capacity
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        # (次数, 序号, 元素) 的最小堆，每个元素一项，次数可能已经过时 (偏小)
+        self._heap = []
+        self._seq = count()
+        if iterable is not None:
+            self.update(iterable)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, item):
+        return item in self._counts
+
+    def __getitem__(self, item):
+        return self._counts.get(item, 0)
+
+    def error(self, item):
+        """item 的次数最多多算了这么多"""
+        return self._errors.get(item, 0)
+
+    def update(self, iterable, chunk_size=1 << 18):
+        """
+        iterable 可以是元素序列，也可以是 {元素: 次数} 的映射，
+        序列先按块交给 Counter 汇总 (C实现)，每块的准确次数再整个合并进来，
+        比一个一个 add() 快得多，误差上限不变
+        """
+        if hasattr(iterable, 'items'):
+            self._merge(iterable, {}, 0, sum(iterable.values()))
+            return
+        it = iter(iterable)
+        while True:
+            chunk = Counter(islice(it, chunk_size))
+            if not chunk:
+                break
+            self._merge(chunk, {}, 0, sum(chunk.values()))
+
+    def add(self, item, n=1):
+        self.total += n
+        counts = self._counts
+        if item in counts:
+            counts[item] += n
+            return
+        if len(counts) < self.capacity:
+            counts[item] = n
+            self._errors[item] = 0
+            heapq.heappush(self._heap, (n, next(self._seq), item))
+            return
+        low = self._pop_min()
+        del self._errors[low]
+        floor = counts.pop(low)
+        counts[item] = floor + n
+        self._errors[item] = floor
+        heapq.heappush(self._heap, (floor + n, next(self._seq), item))
+
+    def _pop_min(self):
+        """取出次数最少的元素，堆里过时的次数顺便更新"""
+        heap, counts = self._heap, self._counts
+        while True:
+            n, _, item = heap[0]
+            if counts[item] == n:
+                heapq.heappop(heap)
+                return item
+            heapq.heapreplace(heap, (counts[item], next(self._seq), item))
+
+    def _floor(self):
+        """没记录的元素最多出现过的次数"""
+        if len(self._counts) < self.capacity:
+            return 0
+        return min(self._counts.values())
+
+    def most_common(self, n=None):
+        if n is None:
+            return sorted(self._counts.items(), key=lambda x: x[1], reverse=True)
+        return heapq.nlargest(n, self._counts.items(), key=lambda x: x[1])
+
+    def merge(self, other):
+        """合并另一个 HeavyHitters，误差上限是两者之和"""
+        self._merge(other._counts, other._errors, other._floor(), other.total)
+
+    def _merge(self, other_counts, other_errors, other_floor, other_total):
+        """
+        两边都没记录的元素，次数按各自的下限 (_floor) 算，
+        合并后保留次数最多的 capacity 个 (mergeable summaries)
+        """
+        counts, errors, floor = self._counts, self._errors, self._floor()
+        merged = {}
+        for item, n in other_counts.items():
+            merged[item] = counts.get(item, floor) + n
+        for item, n in counts.items():
+            if item not in other_counts:
+                merged[item] = n + other_floor
+        if len(merged) > self.capacity:
+            merged = dict(heapq.nlargest(self.capacity, merged.items(), key=itemgetter(1)))
+        self._errors = {item: errors.get(item, floor) + other_errors.get(item, other_floor) for item in merged}
+        self._counts = merged
+        self.total += other_total
+        self._heap = [(n, next(self._seq), item) for item, n in merged.items()]
+        heapq.heapify(self._heap)
 
 
 def most_freqency():
@@ -20,6 +142,11 @@ def most_freqency():
     print(top_three)
     # Outputs [('eyes', 8), ('the', 5), ('look', 4)]
 
+    # 只记5个单词的次数
+    word_counts = HeavyHitters(5, words)
+    print(word_counts.most_common(3))
+    # Outputs [('eyes', 8), ('the', 5), ('look', 4)]
+
+
 if __name__ == '__main__':
     most_freqency()
-
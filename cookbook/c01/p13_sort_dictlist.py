@@ -4,6 +4,163 @@
 Topic: 排序dict列表
 Desc : 
 """
+from collections import Counter
+from itertools import accumulate
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class RecordBatch:
+    """
+    一批dict记录按列存储，每个字段一个列表，只在 from_rows() 时转换一次。
+
+    argsort() 按多个字段做稳定排序，顺序和
+    sorted(rows, key=itemgetter(*fields)) 一样，但不用为每条记录生成
+    key 元组: 从最后一个字段开始逐个字段排序 (稳定排序保证结果正确)，
+    有 numpy 并且每一列的值都能原样放进数组时用 np.lexsort。
+
+    group_by() 先把分组字段的值编码成整数 (factorize)，再按编码排序，
+    每组是一段连续的下标，用到的时候才取出记录。
+    """
+
+    def __init__(self, columns, rows=None):
+        self.columns = columns
+        self.fields = list(columns)
+        # 原来的记录，取记录时直接返回它们，没有的话用列重新组装dict
+        self._rows = rows
+        self._arrays = {}
+        self._size = len(next(iter(columns.values()))) if columns else 0
+
+    @classmethod
+    def from_rows(cls, rows, fields=None):
+        rows = rows if isinstance(rows, list) else list(rows)
+        if fields is None:
+            fields = list(rows[0]) if rows else []
+        return cls({field: [row[field] for row in rows] for field in fields}, rows)
+
+    def __len__(self):
+        return self._size
+
+    def row(self, i):
+        if self._rows is not None:
+            return self._rows[i]
+        return {field: self.columns[field][i] for field in self.fields}
+
+    def rows(self, indices=None):
+        if indices is None:
+            indices = range(self._size)
+        if self._rows is not None:
+            return list(map(self._rows.__getitem__, indices))
+        columns = [self.columns[field] for field in self.fields]
+        return [dict(zip(self.fields, values))
+                for values in zip(*(map(column.__getitem__, indices) for column in columns))]
+
+    def _array(self, field):
+        """field 列的 numpy 数组，排序结果可能和 sorted() 不一样时返回 None"""
+        if field not in self._arrays:
+            self._arrays[field] = self._to_array(self.columns[field])
+        return self._arrays[field]
+
+    @staticmethod
+    def _to_array(column):
+        # 只接受同一种类型的值: int 和 float 混在一起会全部转成 float64，
+        # 大的 int 会丢掉精度，字符串数组会丢掉末尾的 '\x00'，NaN 和
+        # sorted() 的比较结果不一样
+        types = set(map(type, column))
+        if len(types) != 1:
+            return None
+        kind = types.pop()
+        if kind is int:
+            if min(column) < -2 ** 63 or max(column) >= 2 ** 63:
+                return None
+            return np.array(column, dtype=np.int64)
+        if kind is float:
+            array = np.array(column, dtype=np.float64)
+            return None if np.isnan(array).any() else array
+        if kind is str:
+            if any(value.endswith('\x00') for value in column):
+                return None
+            return np.array(column, dtype=str)
+        return None
+
+    def argsort(self, *fields):
+        """按 fields 稳定排序后的下标列表"""
+        if not self._size:
+            return []
+        if np is not None:
+            arrays = [self._array(field) for field in fields]
+            if all(array is not None for array in arrays):
+                # lexsort 以最后一个数组为主键，也是稳定的
+                return np.lexsort(arrays[::-1]).tolist()
+        order = list(range(self._size))
+        for field in reversed(fields):
+            order.sort(key=self.columns[field].__getitem__)
+        return order
+
+    def sort_by(self, *fields):
+        """和 sorted(rows, key=itemgetter(*fields)) 一样的记录列表"""
+        return self.rows(self.argsort(*fields))
+
+    def factorize(self, *fields, sort=True):
+        """
+        每条记录分组值的整数编码和所有不同的分组值，
+        sort=True 时编码按分组值的大小排，否则按第一次出现的顺序
+        """
+        if not self._size:
+            return [], []
+        keys = self.columns[fields[0]] if len(fields) == 1 else list(zip(*(self.columns[f] for f in fields)))
+        index = {}
+        codes = [index.setdefault(key, len(index)) for key in keys]
+        uniques = list(index)
+        if sort:
+            ranks = sorted(range(len(uniques)), key=uniques.__getitem__)
+            uniques = [uniques[i] for i in ranks]
+            remap = [0] * len(ranks)
+            for code, i in enumerate(ranks):
+                remap[i] = code
+            codes = [remap[code] for code in codes]
+        return codes, uniques
+
+    def group_by(self, *fields, sort=True):
+        """
+        (分组值, RowSlice) 的迭代器，组内记录保持原来的顺序。
+        sort=True 和先 sort() 再 itertools.groupby 的顺序一样，
+        sort=False 和 defaultdict(list) 的顺序一样 (按第一次出现)
+        """
+        codes, uniques = self.factorize(*fields, sort=sort)
+        order = sorted(range(self._size), key=codes.__getitem__)
+        counts = Counter(codes)
+        stops = accumulate(counts[code] for code in range(len(uniques)))
+        start = 0
+        for key, stop in zip(uniques, stops):
+            yield key, RowSlice(self, order, start, stop)
+            start = stop
+
+
+class RowSlice:
+    """一组记录在 RecordBatch 中的下标，迭代时才取出记录"""
+
+    def __init__(self, batch, order, start, stop):
+        self.batch = batch
+        self._order = order
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def indices(self):
+        return self._order[self.start:self.stop]
+
+    def column(self, field):
+        values = self.batch.columns[field]
+        return [values[i] for i in self.indices()]
+
+    def __iter__(self):
+        return iter(self.batch.rows(self.indices()))
 
 
 def sort_dictlist():
@@ -23,6 +180,14 @@ def sort_dictlist():
     rows_by_lfname = sorted(rows, key=itemgetter('lname','fname'))
     print(rows_by_lfname)
 
+    # 记录很多的时候先转换成列
+    batch = RecordBatch.from_rows(rows)
+    print(batch.sort_by('lname', 'fname') == rows_by_lfname)
+    # Outputs True
+    # 分组 (和 p15_group 中先排序再 groupby 的顺序一样)，每组只是一段下标
+    for lname, group in batch.group_by('lname'):
+        print(lname, len(group), group.column('uid'))
+
+
 if __name__ == '__main__':
     sort_dictlist()
-
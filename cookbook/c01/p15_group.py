@@ -4,10 +4,119 @@
 Topic: 分组迭代
 Desc : 
 """
+import operator
+import pickle
+import tempfile
 from operator import itemgetter
 from itertools import groupby
 
 
+def _append(acc, value):
+    acc.append(value)
+    return acc
+
+
+# 累加器: (第一个值 -> 初始值, (累加值, 新值) -> 新的累加值)
+REDUCERS = {
+    'count': (lambda value: 1, lambda acc, value: acc + 1),
+    'sum': (lambda value: value, operator.add),
+    'min': (lambda value: value, min),
+    'max': (lambda value: value, max),
+    'list': (lambda value: [value], _append),
+}
+# 临时文件最多再分这么多层，之后不管 max_groups 都在内存中分组
+MAX_SPILL_LEVELS = 4
+
+
+def group_reduce(rows, key, reducer='list', value=None, max_groups=100000, partitions=16):
+    """
+    不用先排序的分组，只遍历一次 rows，生成 (分组值, 累加结果)。
+
+    reducer 是 REDUCERS 中的名字或者一对 (first, step) 函数，value(row) 是
+    参与累加的值 (默认就是 row)。内存中最多保留 max_groups 个分组的累加值，
+    之后出现的新分组的 (分组值, value) 按哈希值分到 partitions 个临时文件，
+    最后逐个文件再分组，每个分组只会落在一个文件里，文件里的分组还太多就
+    换个哈希再分，最多 MAX_SPILL_LEVELS 层。
+    内存中的分组按第一次出现的顺序先生成，临时文件中的分组在后面。
+    """
+    if max_groups < 1 or partitions < 1:
+        raise ValueError('max_groups and partitions must be at least 1')
+    first, step = REDUCERS[reducer] if isinstance(reducer, str) else reducer
+    pairs = ((key(row), row if value is None else value(row)) for row in rows)
+    return _reduce(pairs, first, step, max_groups, partitions, 0)
+
+
+def _reduce(pairs, first, step, max_groups, partitions, level):
+    if level >= MAX_SPILL_LEVELS:
+        # 哈希值相同的分组再怎么分也分不开
+        max_groups = float('inf')
+    groups = {}
+    spill = None
+    try:
+        for k, v in pairs:
+            if k in groups:
+                groups[k] = step(groups[k], v)
+            elif len(groups) < max_groups:
+                groups[k] = first(v)
+            else:
+                if spill is None:
+                    spill = _Spill(partitions, level)
+                spill.add(k, v)
+        yield from groups.items()
+        if spill is not None:
+            groups = None
+            for part in spill.partitions():
+                # 每一层的哈希不一样，文件里分组还太多就再分一次
+                yield from _reduce(part, first, step, max_groups, partitions, level + 1)
+    finally:
+        if spill is not None:
+            spill.close()
+
+
+class _Spill:
+    """按分组值的哈希把 (分组值, 值) 分批 pickle 到几个临时文件"""
+
+    def __init__(self, partitions, salt, batch_size=4096):
+        self.salt = salt
+        self.batch_size = batch_size
+        self._files = [tempfile.TemporaryFile() for _ in range(partitions)]
+        self._buffers = [[] for _ in range(partitions)]
+
+    def add(self, key, value):
+        i = hash((self.salt, key)) % len(self._buffers)
+        buffer = self._buffers[i]
+        buffer.append((key, value))
+        if len(buffer) >= self.batch_size:
+            self._flush(self._files[i], buffer)
+
+    @staticmethod
+    def _flush(f, buffer):
+        pickle.dump(buffer, f, pickle.HIGHEST_PROTOCOL)
+        buffer.clear()
+
+    def partitions(self):
+        """逐个文件读回 (分组值, 值)，读完的文件就关掉"""
+        for f, buffer in zip(self._files, self._buffers):
+            if buffer:
+                self._flush(f, buffer)
+            f.seek(0)
+            yield self._load(f)
+            f.close()
+
+    @staticmethod
+    def _load(f):
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+
 def group_iter():
     rows = [
         {'address': '5412 N CLARK', 'date': '07/01/2012'},
@@ -34,5 +143,12 @@ def group_iter():
     for row in rows:
         rows_by_date[row['date']].append(row)
 
+    # 不排序，一遍统计每天的记录数
+    print(dict(group_reduce(rows, key=itemgetter('date'), reducer='count')))
+    # 写临时文件的分组没有固定的顺序
+    print(sorted(group_reduce(rows, key=itemgetter('date'), reducer='max',
+                              value=itemgetter('address'), max_groups=2, partitions=2)))
+
+
 if __name__ == '__main__':
-    group_iter()
\ No newline at end of file
+    group_iter()
@@ -3,4 +3,18 @@
 def setup(app): 
     import sphinx.search as search
     import zh
-    search.languages["zh_CN"] = zh.SearchChinese
\ No newline at end of file
+    import searchshards
+    search.languages["zh_CN"] = zh.SearchChinese
+    app.add_config_value('chinese_search_processes', 0, 'html')
+    app.add_config_value('chinese_search_cache_entries', 100000, 'html')
+    app.add_config_value('chinese_search_cache_size', 32 << 20, 'html')
+    app.add_config_value('chinese_search_cache_file', True, 'html')
+    app.add_config_value('chinese_search_shards', False, 'html')
+    app.connect('builder-inited', zh.configure)
+    app.connect('builder-inited', zh.warm)
+    app.connect('builder-inited', searchshards.restore)
+    app.connect('env-before-read-docs', zh.note_read)
+    app.connect('env-updated', zh.presegment)
+    app.connect('build-finished', zh.finish)
+    app.connect('build-finished', searchshards.write_shards)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+split the html search index into shards fetched on demand
+
+Sphinx writes every term of the book into one searchindex.js that the
+search page has to download and parse before it can answer anything. With
+chinese_search_shards on, the terms and titleterms maps are moved into
+_shards/<key>.js files partitioned by the first character of the term,
+and searchindex.js keeps the small document tables plus a loader that
+fetches the shards the query needs before handing it to Search.query.
+
+Substring matches of the search page only see the shards loaded for the
+query, so they are limited to terms sharing a first character with a
+query word.
+
+Sphinx reads searchindex.js back on the next build to keep the entries of
+pages it does not rewrite, so the complete index is stashed next to the
+doctrees and put back in place when the builder starts.
+"""
+import os
+import json
+import shutil
+
+SHARD_DIR = '_shards'
+STASH = 'searchindex.full.js'
+
+LOADER = u'''(function () {
+  var index = %(index)s, shards = %(shards)s;
+  var script = document.currentScript, loaded = {};
+  var root = script && script.src ? script.src.replace(/[^\\/]*$/, '') :
+    (window.DOCUMENTATION_OPTIONS && DOCUMENTATION_OPTIONS.URL_ROOT) || '';
+  function shardOf(term) {
+    var c = term.charCodeAt(0);
+    if (c >= 0xd800 && c < 0xdc00 && term.length > 1) {
+      c = (c - 0xd800) * 0x400 + term.charCodeAt(1) - 0xdc00 + 0x10000;
+    }
+    return c < 0x80 ? c.toString(16) : 'u' + (c >> 6).toString(16);
+  }
+  window.SearchShards = {
+    add: function (key, shard) {
+      loaded[key] = true;
+      for (var field in shard) {
+        for (var term in shard[field]) { index[field][term] = shard[field][term]; }
+      }
+    }
+  };
+  var query = Search.query;
+  Search.query = function (q) {
+    // the terms Search._parseQuery will look up, excluded -terms too
+    var words = splitQuery(q.trim()), stemmer = new Stemmer();
+    var wanted = [], pending = 0;
+    for (var i = 0; i < words.length; i++) {
+      var word = stemmer.stemWord(words[i].toLowerCase());
+      if (word[0] === '-') { word = word.substr(1); }
+      var key = word && shardOf(word);
+      if (key && shards[key] && !loaded[key] && wanted.indexOf(key) < 0) { wanted.push(key); }
+    }
+    if (!wanted.length) { return query.call(Search, q); }
+    pending = wanted.length;
+    function done() { if (--pending === 0) { query.call(Search, q); } }
+    for (var j = 0; j < wanted.length; j++) {
+      var tag = document.createElement('script');
+      tag.src = root + '%(dir)s/' + wanted[j] + '.js';
+      tag.onload = tag.onerror = done;
+      document.head.appendChild(tag);
+    }
+  };
+  Search.setIndex(index);
+})();
+'''
+
+
+def shard_of(term):
+    """the shard holding term, must agree with shardOf() in LOADER"""
+    c = ord(term[0])
+    return '%x' % c if c < 0x80 else 'u%x' % (c >> 6)
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+
+def _searchindex(app):
+    """path of the html builder's javascript search index, None for other builders"""
+    if not app.config.chinese_search_shards:
+        return None
+    filename = getattr(app.builder, 'searchindex_filename', '')
+    if not filename.endswith('.js'):
+        return None
+    return os.path.join(app.outdir, filename)
+
+
+def restore(app):
+    """builder-inited: put the complete index back for Sphinx to load"""
+    searchindex = _searchindex(app)
+    stash = os.path.join(app.doctreedir, STASH)
+    if searchindex and os.path.exists(stash):
+        shutil.copyfile(stash, searchindex)
+
+
+def write_shards(app, exception):
+    """build-finished: stash the complete index and publish the sharded one"""
+    searchindex = _searchindex(app)
+    indexer = getattr(app.builder, 'indexer', None)
+    if exception or not searchindex or indexer is None or not os.path.exists(searchindex):
+        return
+    shutil.copyfile(searchindex, os.path.join(app.doctreedir, STASH))
+    index = indexer.freeze()
+    shards = {}
+    for field in ('terms', 'titleterms'):
+        for term, docs in index[field].items():
+            shard = shards.setdefault(shard_of(term), {'terms': {}, 'titleterms': {}})
+            shard[field][term] = docs
+        index[field] = {}
+    shard_dir = os.path.join(app.outdir, SHARD_DIR)
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    os.makedirs(shard_dir)
+    for key, shard in shards.items():
+        with open(os.path.join(shard_dir, key + '.js'), 'w', encoding='utf-8') as out_file:
+            out_file.write(u'SearchShards.add(%s,%s);\n' % (_dumps(key), _dumps(shard)))
+    with open(searchindex, 'w', encoding='utf-8') as out_file:
+        out_file.write(LOADER % {'index': _dumps(index), 'dir': SHARD_DIR,
+                                 'shards': _dumps(dict.fromkeys(shards, 1))})
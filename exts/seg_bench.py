@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark smallseg over the book's own source/c*/*.rst files
+
+    python exts/seg_bench.py [--repeat N] [--profile N] [--json FILE]
+
+Every trie backend / engine / dictionary cache combination runs in its own
+process, so the numbers do not leak into each other, and reports:
+
+    load        seconds spent in SEG() (a cache hit or a full build)
+    rss         MB resident after SEG(), and the peak of the whole run
+    tokens/s    best of --repeat passes of cut() over the corpus
+    hot spots   the --profile functions with the most own time (cProfile)
+
+--json writes all of it ("-" for stdout) to keep runs comparable over time.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import pstats
+import hashlib
+import argparse
+import platform
+import subprocess
+import cProfile
+
+from smallseg import SEG, TRIES, ENGINES
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def corpus():
+    texts = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'source', 'c*', '*.rst'))):
+        with open(path, encoding='utf-8') as in_file:
+            texts.append(in_file.read())
+    return texts
+
+
+def rss_mb():
+    """current resident set size, None where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as in_file:
+            return int(in_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2.0 ** 20
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2.0 ** (20 if sys.platform == 'darwin' else 10)
+
+
+def bench(cut, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = 0
+        for text in texts:
+            tokens += len(cut(text))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return tokens, best
+
+
+def hot_spots(cut, texts, limit):
+    profile = cProfile.Profile()
+    profile.enable()
+    for text in texts:
+        cut(text)
+    profile.disable()
+    stats = pstats.Stats(profile).sort_stats('tottime')
+    spots = []
+    for func in stats.fcn_list[:limit]:
+        calls, _, tottime, cumtime, _ = stats.stats[func]
+        filename, line, name = func
+        spots.append({'function': '%s:%d(%s)' % (os.path.basename(filename), line, name),
+                      'calls': calls, 'tottime': round(tottime, 4), 'cumtime': round(cumtime, 4)})
+    return spots
+
+
+def run_one(trie, engine, cache, repeat, profile):
+    """measure one configuration in this process"""
+    texts = corpus()
+    base = rss_mb()
+    start = time.perf_counter()
+    seg = SEG(cache=cache, trie=trie, engine=engine)
+    load = time.perf_counter() - start
+    loaded = rss_mb()
+    tokens, elapsed = bench(seg.cut, texts, repeat)
+    result = {
+        'trie': trie, 'engine': engine, 'cache': cache,
+        'load_seconds': round(load, 4),
+        'rss_mb': None if base is None else round(loaded - base, 1),
+        'tokens': tokens,
+        'cut_seconds': round(elapsed, 4),
+        'tokens_per_second': round(tokens / elapsed),
+        'hot_spots': hot_spots(seg.cut, texts, profile) if profile else [],
+    }
+    # after profiling too, which holds on to its own stats
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def configurations():
+    for trie in sorted(TRIES):
+        for engine in sorted(ENGINES):
+            if trie == 'array':  # the only backend with a cache to load
+                yield trie, engine, True
+            yield trie, engine, False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark smallseg on source/c*/*.rst')
+    parser.add_argument('--repeat', type=int, default=3, help='passes over the corpus, the best counts')
+    parser.add_argument('--profile', type=int, default=5, help='hot spots to report, 0 to skip profiling')
+    parser.add_argument('--json', help='write the results as JSON to this file, - for stdout')
+    parser.add_argument('--one', nargs=3, metavar=('TRIE', 'ENGINE', 'CACHE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.one:
+        trie, engine, cache = args.one
+        json.dump(run_one(trie, engine, cache == '1', args.repeat, args.profile), sys.stdout)
+        return
+
+    texts = corpus()
+    SEG()  # make sure the dictionary cache exists before anything is timed
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {
+            'files': len(texts),
+            'characters': sum(len(t) for t in texts),
+            'sha1': hashlib.sha1('\0'.join(texts).encode('utf-8')).hexdigest(),
+        },
+        'results': [],
+    }
+    out = sys.stderr if args.json == '-' else sys.stdout
+    print('%(files)d files, %(characters)d characters' % report['corpus'], file=out)
+    for trie, engine, cache in configurations():
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--one', trie, engine, '1' if cache else '0',
+             '--repeat', str(args.repeat), '--profile', str(args.profile)],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+        result = json.loads(child.stdout.decode('utf-8'))
+        report['results'].append(result)
+        print('%-5s %-3s %-8s load %6.3fs  rss %6s MB  peak %6s MB  %8d tokens/s'
+              % (trie, engine, 'cache' if cache else 'no cache', result['load_seconds'],
+                 result['rss_mb'], result['peak_rss_mb'] and round(result['peak_rss_mb']),
+                 result['tokens_per_second']), file=out)
+        for spot in result['hot_spots']:
+            print('      %8.3fs %9d  %s' % (spot['tottime'], spot['calls'], spot['function']), file=out)
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+    elif args.json:
+        with open(args.json, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+
+def _size(tokens):
+    return sum(len(t) for t in tokens) + len(tokens)
+
+
+class CutCache(object):
+    """
+    LRU cache of segmentation results keyed by the sha1 of the text,
+    prefixed with salt (e.g. the dictionary signature, so results cut with
+    another dictionary are never returned).
+
+    Entries are evicted least recently used first once there are more
+    than max_entries of them or their tokens add up to more than max_size
+    characters. With a path the cache is also kept in a sqlite file: a
+    miss in memory falls back to it, new results are written to it and
+    close() trims it with the same limits, so the next build starts warm.
+    """
+
+    def __init__(self, max_entries=100000, max_size=32 << 20, path=None, salt=b''):
+        self.salt = salt
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path)
+            self._db.execute('CREATE TABLE IF NOT EXISTS cuts '
+                             '(key BLOB PRIMARY KEY, tokens TEXT, size INTEGER, used INTEGER)')
+            # every run gets a newer stamp, close() keeps the freshest rows
+            self._stamp = self._db.execute('SELECT COALESCE(MAX(used), 0) + 1 FROM cuts').fetchone()[0]
+            self._used = []
+
+    def _key(self, text):
+        return hashlib.sha1(self.salt + text.encode('utf-8')).digest()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, text):
+        key = self._key(text)
+        if key in self._entries:
+            return True
+        if self._db is not None:
+            return self._db.execute('SELECT 1 FROM cuts WHERE key = ?', (key,)).fetchone() is not None
+        return False
+
+    def get(self, text):
+        """the cached tokens of text, None on a miss"""
+        key = self._key(text)
+        tokens = self._entries.get(key)
+        if tokens is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return tokens
+        if self._db is not None:
+            row = self._db.execute('SELECT tokens FROM cuts WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                tokens = json.loads(row[0])
+                self._used.append((self._stamp, key))
+                self._remember(key, tokens)
+                self.disk_hits += 1
+                return tokens
+        self.misses += 1
+        return None
+
+    def put(self, text, tokens):
+        key = self._key(text)
+        if key in self._entries:
+            return
+        self._remember(key, tokens)
+        if self._db is not None:
+            self._db.execute('INSERT OR REPLACE INTO cuts VALUES (?, ?, ?, ?)',
+                             (key, json.dumps(tokens), _size(tokens), self._stamp))
+
+    def _remember(self, key, tokens):
+        self._entries[key] = tokens
+        self.size += _size(tokens)
+        while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_size):
+            _, old = self._entries.popitem(last=False)
+            self.size -= _size(old)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'size': self.size, 'hits': self.hits,
+                'disk_hits': self.disk_hits, 'misses': self.misses}
+
+    def close(self):
+        """flush and trim the sqlite file"""
+        if self._db is None:
+            return
+        db, self._db = self._db, None
+        with db:
+            db.executemany('UPDATE cuts SET used = ? WHERE key = ?', self._used)
+            db.execute('DELETE FROM cuts WHERE key NOT IN '
+                       '(SELECT key FROM cuts ORDER BY used DESC LIMIT ?)', (self.max_entries,))
+            db.execute('DELETE FROM cuts WHERE key IN (SELECT key FROM '
+                       '(SELECT key, SUM(size) OVER (ORDER BY used DESC, key) AS total FROM cuts) '
+                       'WHERE total > ?)', (self.max_size,))
+        db.close()
@@ -1,38 +1,51 @@
 # -*- coding: utf-8 -*-
-from __future__ import print_function
 import re
 import os
 import sys
+import mmap
+import struct
+import hashlib
+from array import array
+from bisect import bisect_left
 
-try:
-    xrange          # Python 2
-except NameError:
-    xrange = range  # Python 3
 
-class SEG(object):
+TERMINAL = chr(11)
+_TERMINAL_CODE = ord(TERMINAL)
+# what ArrayTrie.child() gives for TERMINAL
+_LEAF = {}
+
+# punctuation that separates unregistered words, mapped to spaces
+_PUNCTUATION = {ord(c): ' ' for c in "。，,！…!《》<>\"':：？?、|“”‘’；—（）·()\u3000"}
+# runs of an unregistered span: (ascii word, ) or (, anything else up to a space)
+_RUNS = re.compile(r"([0-9A-Za-z\-\+#@_\.]+)|([^0-9A-Za-z\-\+#@_\.\s]+)")
+_WORD_CHAR = re.compile(r"[\w\u2E80-\u9FFF]")
+
+
+class DictTrie:
+    """
+    the original trie: nested dicts keyed by the characters of each word
+    read backwards, '' for leaves and TERMINAL marking a word start
+    """
+
     def __init__(self):
-        _localDir=os.path.dirname(__file__)
-        _curpath=os.path.normpath(os.path.join(os.getcwd(),_localDir))
-        curpath=_curpath
-        self.d = {}
-        print("loading dict...", file=sys.stderr)
-        with open(os.path.join(curpath, "main.dic")) as in_file:
-            self.set([x.rstrip() for x in in_file])
-        with open(os.path.join(curpath,"suffix.dic")) as in_file:
-            self.specialwords= set([x.rstrip().decode('utf-8') for x in in_file])
-        print('dict ok.', file=sys.stderr)
-    #set dictionary(a list)
-    def set(self,keywords):
-        p = self.d
+        self.root = {}
+
+    def child(self, p, ch):
+        if ch in p:
+            return p[ch]
+        return None
+
+    def add(self, keywords):
+        p = self.root
         q = {}
         k = ''
         for word in keywords:
-            word = (chr(11)+word).decode('utf-8')
-            if len(word)>5:
+            word = TERMINAL + word
+            if len(word) > 5:
                 continue
-            p = self.d
+            p = self.root
             ln = len(word)
-            for i in xrange(ln-1,-1,-1):
+            for i in range(ln-1,-1,-1):
                 char = word[i].lower()
                 if p=='':
                     q[k] = {}
@@ -42,110 +55,534 @@ class SEG(object):
                     q = p
                     k = char
                 p = p[char]
-    
-    def _binary_seg(self,s):
+
+    def remove(self, keywords):
+        for key in _keys(keywords):
+            p = self.root
+            for ch in key[:-1]:
+                p = self.child(p, ch)
+                if p is None:
+                    break
+            else:
+                if TERMINAL in p:
+                    del p[TERMINAL]
+
+    @classmethod
+    def build(cls, keywords):
+        trie = cls()
+        trie.add(keywords)
+        return trie
+
+
+class ArrayTrie:
+    """
+    the same trie as DictTrie flattened into uint32 arrays: the edges of
+    node n are labels[starts[n]:ends[n]] (sorted code points) and the
+    matching targets[...]. A node costs 8 bytes and an edge 8, against a
+    few hundred bytes of dict per node. The arrays are written to one flat
+    file and mapped back with mmap, so loading costs no parsing at all.
+
+    Built tries number their nodes breadth first and lay the edge blocks
+    out back to back. add() copies mapped arrays to the heap on first use,
+    appends new nodes and moves the edge block of a node that gains a
+    child to the end, so updates never shift the rest of the arrays.
+
+    Lookups go through dicts like DictTrie's: root is the dict of the
+    root's edges, and child() turns the edge block of each node it reaches
+    into a dict the first time, in place of the node number in its
+    parent's dict. Only the nodes real text walks through (a few thousand,
+    a few MB) are expanded; past CACHE_NODES of them new nodes are expanded
+    on every visit instead of kept.
+    """
+    MAGIC = b'SEGT'
+    VERSION = 3
+    # magic, version, itemsize, byteorder, source size, source mtime_ns,
+    # source sha1, overlay sha1, number of nodes, number of edges
+    HEADER = struct.Struct('=4sHH8sqq20s20sII')
+
+    CACHE_NODES = 1 << 14
+
+    def __init__(self, starts, ends, labels, targets):
+        self.starts = starts
+        self.ends = ends
+        self.labels = labels
+        self.targets = targets
+        # node number -> the dict child() expanded it to
+        self._edges = {}
+        self.root = self._edges[0] = self._expand(0)
+        self.child = self._child()
+
+    def _child(self):
+        # a closure saves the attribute lookups of a method on every step
+        cached = self._edges
+        expand, limit = self._expand, self.CACHE_NODES
+
+        def child(p, ch):
+            c = p.get(ch)
+            if c.__class__ is int:
+                edges = expand(c)
+                if len(cached) < limit:
+                    cached[c] = p[ch] = edges
+                c = edges
+            return c
+        return child
+
+    def _expand(self, n):
+        labels, targets = self.labels, self.targets
+        edges = {}
+        for k in range(self.starts[n], self.ends[n]):
+            # nothing ever hangs below TERMINAL, share one empty leaf
+            edges[chr(labels[k])] = _LEAF if labels[k] == _TERMINAL_CODE else targets[k]
+        return edges
+
+    def _search(self, n, ch):
+        """the child of node number n for ch, straight from the arrays"""
+        lo = self.starts[n]
+        hi = self.ends[n]
+        if lo == hi:
+            return None
+        try:
+            c = ord(ch)
+        except TypeError:  # lower() gave more than one code point
+            return None
+        k = bisect_left(self.labels, c, lo, hi)
+        if k < hi and self.labels[k] == c:
+            return self.targets[k]
+        return None
+
+    @classmethod
+    def build(cls, keywords):
+        keys = sorted(_keys(keywords))
+        first = array('I', [0])
+        labels = array('I')
+        targets = array('I')
+        # pending nodes, each one the range of keys sharing its path
+        lows = array('I', [0])
+        highs = array('I', [len(keys)])
+        depths = array('B', [0])
+        n = 0
+        while n < len(lows):
+            i, hi, depth = lows[n], highs[n], depths[n]
+            n += 1
+            while i < hi:
+                if len(keys[i]) == depth:  # leaf below TERMINAL
+                    i += 1
+                    continue
+                ch = keys[i][depth]
+                j = i + 1
+                while j < hi and keys[j][depth] == ch:
+                    j += 1
+                labels.append(ord(ch))
+                targets.append(len(lows))
+                lows.append(i)
+                highs.append(j)
+                depths.append(depth + 1)
+                i = j
+            first.append(len(labels))
+        return cls(first[:-1], first[1:], labels, targets)
+
+    def add(self, keywords):
+        self._writable()
+        for key in _keys(keywords):
+            n = 0
+            for ch in key:
+                c = self._search(n, ch)
+                if c is None:
+                    c = self._add_edge(n, ch)
+                n = c
+
+    def remove(self, keywords):
+        self._writable()
+        for key in _keys(keywords):
+            n = 0
+            for ch in key[:-1]:
+                n = self._search(n, ch)
+                if n is None:
+                    break
+            else:
+                lo, hi = self.starts[n], self.ends[n]
+                k = bisect_left(self.labels, ord(TERMINAL), lo, hi)
+                if k < hi and self.labels[k] == ord(TERMINAL):
+                    # close the gap inside the block, the leaf is just dropped
+                    self.labels[k:hi-1] = self.labels[k+1:hi]
+                    self.targets[k:hi-1] = self.targets[k+1:hi]
+                    self.ends[n] = hi - 1
+                    if n in self._edges:
+                        del self._edges[n][TERMINAL]
+
+    def _writable(self):
+        if not isinstance(self.labels, array):
+            self.starts, self.ends, self.labels, self.targets = [
+                array('I', a.tobytes()) for a in (self.starts, self.ends, self.labels, self.targets)]
+
+    def _add_edge(self, n, ch):
+        """give node n a new, empty child for ch and return it"""
+        c = ord(ch)
+        new = len(self.starts)
+        self.starts.append(0)
+        self.ends.append(0)
+        lo, hi = self.starts[n], self.ends[n]
+        k = bisect_left(self.labels, c, lo, hi)
+        base = len(self.labels)
+        for a, item in ((self.labels, c), (self.targets, new)):
+            block = a[lo:hi]
+            block.insert(k - lo, item)
+            a.extend(block)
+        self.starts[n] = base
+        self.ends[n] = len(self.labels)
+        if n in self._edges:
+            self._edges[n][ch] = new
+        return new
+
+    def dump(self, path, source, overlay=None):
+        """
+        write the trie to path, stamped with the identity of the source
+        dictionary and of the overlay (user dictionary) applied on top of it
+        """
+        size, mtime, digest = _source_stamp(source)
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, self.labels.itemsize,
+                                  sys.byteorder.encode('ascii'), size, mtime, digest,
+                                  _overlay_digest(overlay), len(self.starts), len(self.labels))
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tmp, 'wb') as out_file:
+                out_file.write(header)
+                for a in (self.starts, self.ends, self.labels, self.targets):
+                    out_file.write(memoryview(a).cast('B'))
+            # unlike rename, replaces an existing (stale) cache on Windows too
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path, source, overlay=None):
+        """map a trie written by dump(), None if it is missing or stale for source and overlay"""
+        try:
+            with open(path, 'rb') as in_file:
+                mm = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return None
+        if len(mm) < cls.HEADER.size:
+            return None
+        (magic, version, itemsize, byteorder, size, mtime, digest, overlay_digest,
+         nnodes, nedges) = cls.HEADER.unpack_from(mm)
+        if (magic != cls.MAGIC or version != cls.VERSION
+                or itemsize != array('I').itemsize
+                or byteorder.rstrip(b'\0') != sys.byteorder.encode('ascii')
+                or len(mm) != cls.HEADER.size + 2 * itemsize * (nnodes + nedges)
+                or overlay_digest != _overlay_digest(overlay)):
+            return None
+        st = os.stat(source)
+        if (size, mtime) != (st.st_size, _mtime_ns(st)):
+            # touched (e.g. by a checkout) but maybe not changed
+            if _source_stamp(source)[2] != digest:
+                return None
+        mv = memoryview(mm)
+        arrays = []
+        off = cls.HEADER.size
+        for count in (nnodes, nnodes, nedges, nedges):
+            arrays.append(mv[off:off + itemsize * count].cast('I'))
+            off += itemsize * count
+        return cls(*arrays)
+
+
+def _keys(keywords):
+    """trie paths of the words: lowered, read backwards, then TERMINAL"""
+    for word in keywords:
+        word = TERMINAL + word
+        if len(word) > 5:
+            continue
+        yield ''.join([c.lower() for c in reversed(word)])
+
+
+TRIES = {'array': ArrayTrie, 'dict': DictTrie}
+# reverse maximum matching, or the fewest words over all dictionary matches
+ENGINES = {'rmm': '_cut_rmm', 'dag': '_cut_dag'}
+
+
+def signature(user_dict=None):
+    """
+    sha1 over the dictionary files SEG() loads by default, it changes
+    whenever cut() results may
+    """
+    curpath = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for path in ("main.dic", "suffix.dic", user_dict or "user.dic"):
+        path = os.path.join(curpath, path)
+        if os.path.exists(path):
+            digest.update(_source_stamp(path)[2])
+    return digest.digest()
+
+
+def _mtime_ns(st):
+    return getattr(st, 'st_mtime_ns', int(st.st_mtime * 1e9))
+
+
+def _overlay_digest(path):
+    """sha1 of the overlay file, zeros when there is none"""
+    if path is None or not os.path.exists(path):
+        return b'\0' * 20
+    return _source_stamp(path)[2]
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    with open(path, 'rb') as in_file:
+        digest = hashlib.sha1(in_file.read()).digest()
+    return st.st_size, _mtime_ns(st), digest
+
+
+class SEG:
+    def __init__(self, cache=True, trie='array', engine='rmm', user_dict=None):
+        _localDir=os.path.dirname(__file__)
+        _curpath=os.path.normpath(os.path.join(os.getcwd(),_localDir))
+        curpath=_curpath
+        self._trie_class = TRIES[trie]
+        self._cut = getattr(self, ENGINES[engine])
+        print("loading dict...", file=sys.stderr)
+        self._dic = os.path.join(curpath, "main.dic")
+        self.user_dict = user_dict or os.path.join(curpath, "user.dic")
+        # only the flat layout can be mapped back; the cache holds main.dic
+        # with the user dictionary already applied
+        cache = cache and hasattr(self._trie_class, 'load')
+        self._cache_path = self._dic + '.cache' if cache else None
+        self.trie = self._trie_class.load(self._cache_path, self._dic, self.user_dict) if cache else None
+        if self.trie is None:
+            with open(self._dic, encoding='utf-8') as in_file:
+                self.set(x.rstrip() for x in in_file)
+            if os.path.exists(self.user_dict):
+                self._merge_user_dict()
+            self._save()
+        with open(os.path.join(curpath, "suffix.dic"), encoding='utf-8') as in_file:
+            self.specialwords = {x.rstrip() for x in in_file}
+        print('dict ok.', file=sys.stderr)
+    # set dictionary (an iterable of str)
+    def set(self, keywords):
+        self.trie = self._trie_class.build(keywords)
+
+    def add_words(self, words, persist=False):
+        """
+        add words to the live dictionary; with persist they are also
+        appended to the user dictionary, so later SEG()s load them too.
+        Like main.dic entries, words longer than four characters are ignored
+        """
+        words = list(words)
+        self.trie.add(words)
+        if persist:
+            self._append_user_dict(words)
+            self._save()
+
+    def remove_words(self, words, persist=False):
+        """remove words from the live dictionary, see add_words()"""
+        words = list(words)
+        self.trie.remove(words)
+        if persist:
+            self._append_user_dict('-' + w for w in words)
+            self._save()
+
+    def _save(self):
+        """rewrite the compiled cache from the live trie, stamped with the user dictionary"""
+        if self._cache_path is None:
+            return
+        try:
+            self.trie.dump(self._cache_path, self._dic, self.user_dict)
+        except (IOError, OSError):
+            return  # read-only checkout, just rebuild next time
+        # swap the heap copy for the shared, file backed one
+        self.trie = self._trie_class.load(self._cache_path, self._dic, self.user_dict) or self.trie
+
+    def _merge_user_dict(self):
+        # one word per line, "-word" removes it again, "#" starts a comment;
+        # lines apply in order on top of main.dic
+        with open(self.user_dict, encoding='utf-8') as in_file:
+            for line in in_file:
+                word = line.strip()
+                if not word or word.startswith('#'):
+                    continue
+                if word.startswith('-'):
+                    self.trie.remove([word[1:]])
+                else:
+                    self.trie.add([word])
+
+    def _append_user_dict(self, lines):
+        with open(self.user_dict, 'a', encoding='utf-8') as out_file:
+            for line in lines:
+                out_file.write(line + '\n')
+
+    def _binary_seg(self, s):
         ln = len(s)
-        if ln==1:
+        if ln == 1:
             return [s]
+        return [s[i-2:i] for i in range(ln, 1, -1)]
+
+    def _pro_unreg(self, piece):
         R = []
-        for i in xrange(ln,1,-1):
-            tmp = s[i-2:i]
-            R.append(tmp)
-        return R
-    
-    def _pro_unreg(self,piece):
-        #print(piece)
-        R = []
-        tmp = re.sub(u"。|，|,|！|…|!|《|》|<|>|\"|'|:|：|？|\?|、|\||“|”|‘|’|；|—|（|）|·|\(|\)|　"," ",piece).split()
-        ln1 = len(tmp)
-        for i in xrange(len(tmp)-1,-1,-1):
-            mc = re.split(r"([0-9A-Za-z\-\+#@_\.]+)",tmp[i])
-            for j in xrange(len(mc)-1,-1,-1):
-                r = mc[j]
-                if re.search(r"([0-9A-Za-z\-\+#@_\.]+)",r)!=None:
-                    R.append(r)
-                else:
-                    R.extend(self._binary_seg(r))
+        for word, other in reversed(_RUNS.findall(piece.translate(_PUNCTUATION))):
+            if word:
+                R.append(word)
+            else:
+                R.extend(self._binary_seg(other))
         return R
-        
-        
-    def cut(self,text):
+
+    def cut(self, text):
+        """
+        segment text (str, or utf-8 bytes), tokens come out right to left
+        """
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', 'ignore')
+        return self._cut(text, self.trie.root, self.trie.child)
+
+    def cut_many(self, texts):
+        """
+        lazily segment an iterable of str, yielding one token list per text
         """
+        root = self.trie.root
+        child = self.trie.child
+        _cut = self._cut
+        for text in texts:
+            yield _cut(text, root, child)
+
+    def cut_stream(self, in_file):
+        """
+        lazily segment a text file line by line, yielding tokens in
+        reading order: the tokens of each line left to right, i.e.
+        reversed(cut(line)) for one line after the other. Every line is
+        cut on its own, so around line breaks the tokens can differ from
+        reversed(cut()) of the whole file
+        """
+        root = self.trie.root
+        child = self.trie.child
+        _cut = self._cut
+        for line in in_file:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', 'ignore')
+            tokens = _cut(line, root, child)
+            tokens.reverse()
+            yield from tokens
+
+    def _lower(self, text):
+        low = text.lower()
+        if len(low) != len(text) or '\u03a3' in text:
+            # lower() changed the length or has a final sigma in context,
+            # fall back to lowering one character at a time
+            low = [c.lower() for c in text]
+        return low
+
+    def _cut_dag(self, text, root, child):
         """
-        text = text.decode('utf-8','ignore')
-        p = self.d
+        find every dictionary word in one pass (the trie is keyed
+        backwards, so walk back from each end position, at most four
+        steps) and keep the segmentation with the fewest tokens, then the
+        fewest single characters; characters no word covers are left to
+        _pro_unreg like in _cut_rmm
+        """
+        low = self._lower(text)
+        ln = len(text)
+        tokens = [0] * (ln + 1)
+        singles = [0] * (ln + 1)
+        start = list(range(-1, ln))  # start of the last token ending at e
+        known = bytearray(ln + 1)
+        for e in range(1, ln + 1):
+            best = (tokens[e-1] + 1, singles[e-1] + 1)
+            p = root
+            k = e - 1
+            while k >= 0:
+                p = child(p, low[k])
+                if p is None:
+                    break
+                if child(p, TERMINAL) is not None:
+                    cost = (tokens[k] + 1, singles[k] + (k == e - 1))
+                    if cost <= best:
+                        best = cost
+                        start[e] = k
+                        known[e] = 1
+                k -= 1
+            tokens[e], singles[e] = best
+        recognised = []
+        z = e = ln
+        while e > 0:
+            s = start[e]
+            if known[e]:
+                if e < z:
+                    recognised.extend(self._pro_unreg(text[e:z]))
+                recognised.append(text[s:e])
+                z = s
+            e = s
+        if z > 0:
+            recognised.extend(self._pro_unreg(text[:z]))
+        return recognised
+
+    def _cut_rmm(self, text, root, child):
+        specialwords = self.specialwords
+        pro_unreg = self._pro_unreg
+        low = self._lower(text)
+        p = root
         ln = len(text)
-        i = ln 
+        i = ln
         j = 0
         z = ln
         q = 0
         recognised = []
         mem = None
         mem2 = None
-        while i-j>0:
-            t = text[i-j-1].lower()
-            #print(i,j,t,mem)
-            if not (t in p):
-                if (mem!=None) or (mem2!=None):
-                    if mem!=None:
-                        i,j,z = mem
+        while i-j > 0:
+            t = low[i-j-1]
+            c = child(p, t)
+            if c is None:
+                if mem is not None or mem2 is not None:
+                    if mem is not None:
+                        i, j, z = mem
                         mem = None
-                    elif mem2!=None:
+                    else:
                         delta = mem2[0]-i
-                        if delta>=1:
-                            if (delta<5) and (re.search(u"[\w\u2E80-\u9FFF]",t)!=None):
-                                pre = text[i-j]
-                                #print(pre)
-                                if not (pre in self.specialwords):
-                                    i,j,z,q = mem2
+                        if delta >= 1:
+                            if delta < 5 and _WORD_CHAR.search(t) is not None:
+                                if text[i-j] not in specialwords:
+                                    i, j, z, q = mem2
                                     del recognised[q:]
                             mem2 = None
-                            
-                    p = self.d
-                    if((i<ln) and (i<z)):
-                        unreg_tmp = self._pro_unreg(text[i:z])
-                        recognised.extend(unreg_tmp)
+                    p = root
+                    if i < ln and i < z:
+                        recognised.extend(pro_unreg(text[i:z]))
                     recognised.append(text[i-j:i])
-                    #print(text[i-j:i],mem2)
                     i = i-j
                     z = i
                     j = 0
                     continue
                 j = 0
                 i -= 1
-                p = self.d
+                p = root
                 continue
-            p = p[t]
-            j+=1
-            if chr(11) in p:
-                if j<=2:
-                    mem = i,j,z
-                    #print(text[i-1])
-                    if (z-i<2) and (text[i-1] in self.specialwords) and ((mem2==None) or ((mem2!=None and mem2[0]-i>1))):
-                        #print(text[i-1])
+            p = c
+            j += 1
+            if child(p, TERMINAL) is not None:
+                if j <= 2:
+                    mem = i, j, z
+                    if (z-i < 2 and text[i-1] in specialwords
+                            and (mem2 is None or mem2[0]-i > 1)):
                         mem = None
-                        mem2 = i,j,z,len(recognised)
-                        p = self.d
+                        mem2 = i, j, z, len(recognised)
+                        p = root
                         i -= 1
                         j = 0
                     continue
-                    #print(mem)
-                p = self.d
-                #print(i,j,z,text[i:z])
-                if((i<ln) and (i<z)):
-                    unreg_tmp = self._pro_unreg(text[i:z])
-                    recognised.extend(unreg_tmp)
+                p = root
+                if i < ln and i < z:
+                    recognised.extend(pro_unreg(text[i:z]))
                 recognised.append(text[i-j:i])
                 i = i-j
                 z = i
                 j = 0
                 mem = None
                 mem2 = None
-        #print(mem)
-        if mem!=None:
-            i,j,z = mem
-            recognised.extend(self._pro_unreg(text[i:z]))
-            recognised.append(text[i-j:i])        
+        if mem is not None:
+            i, j, z = mem
+            recognised.extend(pro_unreg(text[i:z]))
+            recognised.append(text[i-j:i])
         else:
-            recognised.extend(self._pro_unreg(text[i-j:z]))
+            recognised.extend(pro_unreg(text[i-j:z]))
         return recognised
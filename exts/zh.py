@@ -1,16 +1,154 @@
 # -*- coding: utf-8 -*-
+import os
+import threading
+import multiprocessing
+from docutils import nodes
 from sphinx.search import SearchLanguage
-from smallseg import SEG 
+from smallseg import SEG, signature
+from segcache import CutCache
+
+# the process-wide segmenter, see get_seg()
+_seg = None
+_seg_lock = threading.Lock()
+# results shared by every SearchChinese of the build, see configure()
+_cache = None
+# the docs this build reads (and so writes), see note_read()
+_read_docs = []
+
+
+def get_seg():
+    """
+    the segmenter shared by everything in this process, loaded on first
+    use; pool workers inherit it when they fork and load their own
+    (from the mapped dictionary cache) otherwise
+    """
+    global _seg
+    if _seg is None:
+        with _seg_lock:
+            if _seg is None:
+                print("reading Chiniese dictionary")
+                _seg = SEG()
+    return _seg
+
+
+def _cut_batch(texts):
+    return list(get_seg().cut_many(texts))
+
 
 class SearchChinese(SearchLanguage):
     lang = 'zh'
+    # text -> tokens, filled by presegment() when there is no cache and
+    # emptied by finish()
+    presegmented = {}
 
     def init(self, options):
-        print("reading Chiniese dictionary")
-        self.seg = SEG() 
+        # builders that never search (latex, man, linkcheck...) still
+        # create the language, so the dictionary waits for split()
+        pass
+
+    @property
+    def seg(self):
+        return get_seg()
 
     def split(self, input):
-        return self.seg.cut(input.encode("utf8")) 
+        tokens = self.presegmented.get(input)
+        if tokens is None and _cache is not None:
+            tokens = _cache.get(input)
+        if tokens is None:
+            tokens = self.seg.cut(input)
+            if _cache is not None:
+                _cache.put(input, tokens)
+        return tokens
 
     def word_filter(self, stemmed_word):
         return len(stemmed_word) > 1
+
+
+def _searching(app):
+    """whether this build feeds a search index through SearchChinese"""
+    if not getattr(app.builder, 'search', False):
+        return False
+    from sphinx.search import languages
+    lang = app.config.html_search_language or app.config.language
+    return languages.get(lang) is SearchChinese
+
+
+def warm(app):
+    """
+    builder-inited: load the segmenter in the background while Sphinx is
+    still reading sources, split() then finds it ready
+    """
+    if _seg is None and _searching(app):
+        threading.Thread(target=get_seg, name='chinese-search-warm', daemon=True).start()
+
+
+def configure(app):
+    """
+    builder-inited: set up the segmentation cache, kept next to the
+    doctrees when chinese_search_cache_file is on; builders without a
+    search index never open it
+    """
+    global _cache
+    if app.config.chinese_search_cache_entries <= 0 or not _searching(app):
+        return
+    path = None
+    if app.config.chinese_search_cache_file:
+        path = os.path.join(app.doctreedir, 'segcache.sqlite')
+    _cache = CutCache(app.config.chinese_search_cache_entries,
+                      app.config.chinese_search_cache_size, path, signature())
+
+
+def note_read(app, env, docnames):
+    """
+    env-before-read-docs: remember the docs about to be read, the list
+    itself since later handlers may still change it
+    """
+    global _read_docs
+    _read_docs = docnames
+
+
+def finish(app, exception):
+    """build-finished: flush the cache and report how much it saved"""
+    global _cache, _read_docs
+    SearchChinese.presegmented.clear()
+    _read_docs = []
+    if _cache is None:
+        return
+    stats = _cache.stats()
+    _cache.close()
+    _cache = None
+    if stats['hits'] or stats['disk_hits'] or stats['misses']:
+        print("segmentation cache: %(hits)d hits, %(disk_hits)d from disk, "
+              "%(misses)d misses" % stats)
+
+
+def presegment(app, env):
+    """
+    segment the text of the doctrees read in this build in a process pool
+    before the html builder writes them and feeds the search index, which
+    it does one page at a time in the main process; enabled by
+    chinese_search_processes > 1. Docs written without being read again
+    (e.g. after a template change) are left to split()
+    """
+    processes = app.config.chinese_search_processes
+    if processes <= 1 or not _searching(app):
+        return
+    texts = {}
+    for docname in set(_read_docs) & env.found_docs:
+        doctree = env.get_doctree(docname)
+        # findall() replaced traverse() in docutils 0.18, which now warns
+        walk = getattr(doctree, 'findall', None) or doctree.traverse
+        for node in walk(lambda n: isinstance(n, (nodes.Text, nodes.title))):
+            texts[node.astext()] = None
+    texts = [t for t in texts if _cache is None or t not in _cache]
+    batches = [texts[i:i + 256] for i in range(0, len(texts), 256)]
+    get_seg()  # load (or wait for warm()) before forking, workers share it
+    pool = multiprocessing.Pool(processes)
+    store = SearchChinese.presegmented.__setitem__ if _cache is None else _cache.put
+    try:
+        for batch, result in zip(batches, pool.imap(_cut_batch, batches)):
+            for text, tokens in zip(batch, result):
+                store(text, tokens)
+    finally:
+        pool.close()
+        pool.join()
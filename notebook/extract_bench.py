@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark the cell extraction of fetch_cookbook.py against BeautifulSoup
+
+    python extract_bench.py [--repeat N] [PAGE ...]
+
+PAGE is an .html file or an .rst file (rendered the way --base source does),
+all of ../source/c*/*.rst by default. Every page is checked to give the same
+cells as the BeautifulSoup version fetch_content used before, then both are
+timed over the largest page and over all of them.
+"""
+import re
+import sys
+import glob
+import time
+import argparse
+from copy import deepcopy
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from fetch_cookbook import extract_cells, render_rst
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def soup_cells(content):
+    """the cells as the BeautifulSoup fetch_content extracted them"""
+    soup = BeautifulSoup(content, 'html.parser')
+
+    cell_markdown = {
+        "cell_type": "markdown",
+        "metadata": {},
+        "source": []
+    }
+    cell_code = {
+        "cell_type": "code",
+        "execution_count": None,
+        "metadata": {},
+        "outputs": [],
+        "source": []
+    }
+    cells = []
+    p_header = re.compile('^h(?P<level>\\d)$')
+    for tag in [x for x in soup.descendants if x.name]:
+        if p_header.search(tag.name):
+            cell = deepcopy(cell_markdown)
+            cell['source'].append(
+                '{} {}\n'.format('#' * (int(p_header.search(tag.name).group('level')) + 1), tag.text))
+            cells.append(cell)
+        elif tag.name == 'p':
+            if 'Copyright' in tag.text:
+                continue
+            cell = deepcopy(cell_markdown)
+            cell['source'].append(tag.text)
+            cells.append(cell)
+        elif tag.name == 'pre':
+            if '>>>' not in tag.text:
+                # code
+                source = [re.sub('(^\n*|\n*$)', '', tag.text)]
+            else:
+                # idle
+                source = []
+                for line in tag.text.split('\n'):
+                    if re.search('^(>|\\.){3}', line):
+                        if re.search('^(>|\\.){3}\\s*$', line):
+                            continue
+                        source.append(re.sub('^(>|\\.){3} ', '', line))
+                    else:
+                        if source:
+                            cell = deepcopy(cell_code)
+                            cell['source'].append(re.sub('(^\n*|\n*$)', '', '\n'.join(source)))
+                            cells.append(cell)
+                            source = []
+                        else:
+                            continue
+            if source:
+                cell = deepcopy(cell_code)
+                cell['source'].append('\n'.join(source))
+                cells.append(cell)
+    for cell in cells:
+        for i, text in enumerate(cell['source']):
+            cell['source'][i] = text.replace('¶', '')
+    return cells
+
+
+def read(path):
+    path = Path(path)
+    if path.suffix == '.rst':
+        return render_rst(path).decode('utf-8')
+    return path.read_text(encoding='utf-8')
+
+
+def best(extract, pages, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content in pages:
+            extract(content)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark the notebook cell extraction')
+    parser.add_argument('--repeat', type=int, default=5, help='passes over the pages, the best counts')
+    parser.add_argument('pages', nargs='*', help='.html or .rst pages, ../source/c*/*.rst by default')
+    args = parser.parse_args(argv)
+
+    paths = args.pages or sorted(glob.glob(str(ROOT / 'source' / 'c*' / '*.rst')))
+    pages = [read(path) for path in paths]
+    for path, content in zip(paths, pages):
+        if extract_cells(content) != soup_cells(content):
+            sys.exit('different cells for %s' % path)
+    largest = max(range(len(pages)), key=lambda i: len(pages[i]))
+    print('%d pages, %d characters, all give the same cells' % (len(pages), sum(len(p) for p in pages)))
+    for name, sample in (('largest page (%s)' % Path(paths[largest]).name, [pages[largest]]), ('all pages', pages)):
+        soup = best(soup_cells, sample, args.repeat)
+        stream = best(extract_cells, sample, args.repeat)
+        print('%s\n    BeautifulSoup %8.4fs\n    CellParser    %8.4fs  %.1fx' % (name, soup, stream, soup / stream))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,15 +4,65 @@
 # @Date:   2019/6/19 14:40
 
 # pip install requests beautifulsoup4
+#
+# python fetch_cookbook.py [--base URL] [--workers N] [--per-host N] [--processes N] [--refresh]
+#
+# Sections are downloaded by a pool of worker threads, with at most --per-host
+# requests in flight to any one host, parsed in --processes processes and
+# written by one more thread, all at the same time (see Pipeline); notebooks
+# keep the order of the chapter pages. To try it without readthedocs, serve a
+# local build of the docs:
+#
+#     make html && python -m http.server -d build/html 8000
+#     python fetch_cookbook.py --base http://localhost:8000/
+#
+# --base also takes a local directory, read without any network: a build of
+# the docs (build/html), or the Sphinx source directory itself (source), whose
+# .rst files are rendered with docutils and go through the same extraction.
+#
+# What was fetched is remembered in .fetch_cache.json: pages are requested
+# with If-None-Match / If-Modified-Since, a page whose body did not change is
+# not parsed again, and a notebook is only rewritten when the pages it is made
+# of changed (or it is missing). --refresh starts over from an empty cache.
 
+import argparse
+import glob
+import hashlib
 import json
+import multiprocessing
+import os
+import queue
 import re
-from copy import deepcopy
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from html.parser import HTMLParser
+from functools import partial
+from operator import methodcaller
 from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+from urllib.request import url2pathname
 
 import requests
 from bs4 import BeautifulSoup
 
+BASE = 'https://python3-cookbook.readthedocs.io/zh_CN/latest/'
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/65.0.3325.181 Safari/537.36'}
+# chapters 1-15, the appendix has no recipes
+P_CHAPTER = re.compile(r'chapters/p(0\d|1[0-5])_')
+P_TOCTREE = re.compile(r'^\.\. toctree::\n((?:[ \t]+.*\n|\n)*)', re.M)
+CACHE = '.fetch_cache.json'
+P_HEADER = re.compile(r'^h(?P<level>\d)$')
+P_BLANK_LINES = re.compile(r'(^\n*|\n*$)')
+P_PROMPT = re.compile(r'^(>|\.){3}')
+P_EMPTY_PROMPT = re.compile(r'^(>|\.){3}\s*$')
+P_PROMPT_SPACE = re.compile(r'^(>|\.){3} ')
+# never closed, the same list as bs4 uses
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+             'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+             'nextid', 'spacer'}
+
 TEMPLATE = {
     "cells": [],
     "metadata": {
@@ -52,17 +102,192 @@ TEMPLATE = {
 }
 
 
+class Fetcher:
+    """
+    A requests session shared by worker threads, allowing at most per_host
+    requests in flight to the same host (and as many pooled connections).
+    """
+
+    def __init__(self, per_host=4):
+        self.per_host = per_host
+        self.ss = requests.session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=per_host)
+        self.ss.mount('http://', adapter)
+        self.ss.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _limit(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    def get(self, url, cache=None):
+        """
+        the body of url; with a cache, the request is conditional and None
+        means the page has not changed since it was cached
+        """
+        if local_path(url):
+            return read_local(url)
+        headers = dict(HEADERS, **cache.conditional(url)) if cache else HEADERS
+        with self._limit(url):
+            print(url)
+            response = self.ss.get(url, headers=headers)
+        if cache is not None:
+            if response.status_code == 304:
+                return None
+            cache.validators(url, response.headers)
+        return response.content
+
+
+class PageCache:
+    """
+    What the last runs fetched, kept in a json file: per url the ETag /
+    Last-Modified for conditional requests, the sha1 of the body and the
+    cells extracted from it; per notebook the digest it was written from.
+    """
+    VERSION = 1
+
+    def __init__(self, path=None, refresh=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self.pages = {}
+        self.notebooks = {}
+        if path and not refresh and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            # cells extracted by another version of the script are not reused
+            if data.get('version') == self.VERSION:
+                self.pages = data['pages']
+                self.notebooks = data['notebooks']
+
+    def conditional(self, url):
+        entry = self.pages.get(url, {})
+        headers = {}
+        if 'cells' in entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('modified'):
+                headers['If-Modified-Since'] = entry['modified']
+        return headers
+
+    def validators(self, url, headers):
+        with self._lock:
+            entry = self.pages.setdefault(url, {})
+            entry['etag'] = headers.get('ETag')
+            entry['modified'] = headers.get('Last-Modified')
+
+    def cells(self, url, content):
+        """the cached cells of url if content is None (not modified) or the same body"""
+        entry = self.pages.get(url, {})
+        if 'cells' in entry and (content is None or entry['sha1'] == _sha1(content)):
+            return entry['cells']
+        return None
+
+    def put(self, url, content, cells):
+        with self._lock:
+            entry = self.pages.setdefault(url, {})
+            entry['sha1'] = _sha1(content)
+            entry['cells'] = cells
+
+    def digest(self, url):
+        return self.pages[url]['sha1']
+
+    def stale(self, path, digest):
+        """whether the notebook at path has to be written for digest"""
+        return self.notebooks.get(str(path)) != digest or not path.exists()
+
+    def written(self, path, digest):
+        with self._lock:
+            self.notebooks[str(path)] = digest
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with self._lock, open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'pages': self.pages, 'notebooks': self.notebooks}, f)
+        os.replace(tmp, self.path)
+
+
+def _sha1(content):
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def local_base(base):
+    """a local directory as a file:// url, anything else unchanged"""
+    if urlsplit(base).scheme in ('http', 'https', 'file'):
+        return base
+    return Path(base).resolve().as_uri() + '/'
+
+
+def local_path(url):
+    """the path of a file:// url, None for other urls"""
+    parts = urlsplit(url)
+    return Path(url2pathname(parts.path)) if parts.scheme == 'file' else None
+
+
+def read_local(url):
+    path = local_path(url)
+    if path.is_dir():
+        path = path / 'index.html'
+    print(path)
+    if path.suffix == '.rst':
+        return render_rst(path)
+    return path.read_bytes()
+
+
+def render_rst(path):
+    """html of a .rst page, close enough to the Sphinx one for fetch_content"""
+    from docutils.core import publish_string  # comes with sphinx
+
+    # sphinx-only directives such as toctree are dropped silently
+    return publish_string(path.read_text(encoding='utf-8'), source_path=str(path), writer_name='html5',
+                          settings_overrides={'report_level': 5, 'syntax_highlight': 'none',
+                                              'output_encoding': 'utf-8'})
+
+
+class NotebookWriter:
+    """
+    Writes notebooks made of a template and their cells. The template is
+    copied once and never modified, and every notebook is streamed to a
+    temporary file next to it then renamed over it, so any number of threads
+    can write at the same time and a notebook is never seen half written.
+    """
+
+    def __init__(self, template=TEMPLATE):
+        self.template = json.loads(json.dumps(template))
+
+    def write(self, path, cells):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # named after the thread, unlike tempfile the notebook gets the usual permissions
+        tmp = '{}.{}.tmp'.format(path, threading.get_ident())
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(dict(self.template, cells=cells), f, indent=2)
+            os.replace(tmp, str(path))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
 class Chapter:
-    def __init__(self, chapter_address):
+    def __init__(self, chapter_address, fetcher=None, executor=None, cache=None, writer=None):
         self.chapter_address = chapter_address
         self.path = re.sub('/[^/]+?$', '/', chapter_address)
-        self.ss = requests.session()
+        self.fetcher = fetcher or Fetcher()
+        # sections are fetched in this pool when given, one by one otherwise
+        self.executor = executor
+        self.cache = cache or PageCache()
+        self.writer = writer or NotebookWriter()
 
-    def fetch(self, url):
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/65.0.3325.181 Safari/537.36'}
-        print(url)
-        raw = self.ss.get(url, headers=headers).content
+    def fetch(self, url, cache=None):
+        raw = self.fetcher.get(url, cache)
+        if raw is None:
+            return None
         m = re.search('charset=\W*(?P<charset>\w+)', raw[:200].decode(errors='ignore'))
         charset = m.groupdict().get('charset', 'utf-8')
         if charset == 'gb2312':
@@ -80,96 +305,365 @@ class Chapter:
                 self.sections.append(x['href'])
 
     def fetch_sections(self, sep=False):
+        fetch = partial(self.fetch_section, sep=sep)
+        if self.executor is None:
+            results = map(fetch, self.sections)
+        else:
+            # map() yields in submission order, whatever order the pages arrive in
+            results = self.executor.map(fetch, self.sections)
+        self.write_chapter(list(results))
+
+    def fetch_section(self, href, sep=False):
+        """the cells of a section, also written to its own notebook with sep"""
+        cells = self.fetch_content(self.path + href)
+        if sep:
+            self.write_section(href, cells)
+        return cells
+
+    def write_section(self, href, cells):
+        *_, section_name = href.split('/')
+        path = Path('ipynb', self.chapter_title, '{}.ipynb'.format(section_name.split('.')[0]))
+        self.write(path, cells, self.cache.digest(self.path + href))
+
+    def write_chapter(self, sections):
+        """the chapter notebook, from the cells of all its sections in order"""
         cells = [{
             "cell_type": "markdown",
             "metadata": {},
             "source": ['# {}\n {}'.format(self.chapter_title, self.chapter_desc)]
         }]
-        dpath = Path('ipynb')
-        dpath.mkdir(exist_ok=True)
-        for href in self.sections[:]:
-            _cells = self.fetch_content(self.path + href)
-            if sep:
-                _dpath = dpath / self.chapter_title
-                _dpath.mkdir(exist_ok=True)
-                TEMPLATE['cells'] = _cells
-                *_, section_name = href.split('/')
-                open(str(_dpath / '{}.ipynb'.format(section_name.split('.')[0])), 'w').write(json.dumps(TEMPLATE, indent=2))
+        digests = [self.chapter_title, self.chapter_desc]
+        for href, _cells in zip(self.sections, sections):
+            digests.append(self.cache.digest(self.path + href))
             cells.extend(_cells)
-        TEMPLATE['cells'] = cells
-        open(str(dpath / '{}.ipynb'.format(self.chapter_title)), 'w').write(json.dumps(TEMPLATE, indent=2))
+        self.write(Path('ipynb', '{}.ipynb'.format(self.chapter_title)), cells, _sha1(json.dumps(digests)))
 
-    def fetch_content(self, url):
-        content = self.fetch(url)
-        soup = BeautifulSoup(content, 'html.parser')
+    def write(self, path, cells, digest):
+        if self.cache.stale(path, digest):
+            self.writer.write(path, cells)
+            self.cache.written(path, digest)
 
-        cell_markdown = {
-            "cell_type": "markdown",
-            "metadata": {},
-            "source": []
-        }
-        cell_code = {
-            "cell_type": "code",
-            "execution_count": None,
-            "metadata": {},
-            "outputs": [],
-            "source": []
-        }
-        cells = []
-        p_header = re.compile('^h(?P<level>\d)$')
-        for tag in [x for x in soup.descendants if x.name]:
-            if p_header.search(tag.name):
-                cell = deepcopy(cell_markdown)
-                cell['source'].append(
-                    '{} {}\n'.format('#' * (int(p_header.search(tag.name).group('level')) + 1), tag.text))
-                cells.append(cell)
-            elif tag.name == 'p':
-                if 'Copyright' in tag.text:
-                    continue
-                cell = deepcopy(cell_markdown)
-                cell['source'].append(tag.text)
-                cells.append(cell)
-            elif tag.name == 'pre':
-                if '>>>' not in tag.text:
-                    # code
-                    source = [re.sub('(^\n*|\n*$)', '', tag.text)]
-                else:
-                    # idle
-                    source = []
-                    for line in tag.text.split('\n'):
-                        if re.search('^(>|\.){3}', line):
-                            if re.search('^(>|\.){3}\s*$', line):
-                                continue
-                            source.append(re.sub('^(>|\.){3} ', '', line))
-                        else:
-                            if source:
-                                cell = deepcopy(cell_code)
-                                cell['source'].append(re.sub('(^\n*|\n*$)', '', '\n'.join(source)))
-                                cells.append(cell)
-                                source = []
-                            else:
-                                continue
-                if source:
-                    cell = deepcopy(cell_code)
-                    cell['source'].append('\n'.join(source))
-                    cells.append(cell)
-        for cell in cells:
-            for i, text in enumerate(cell['source']):
-                cell['source'][i] = text.replace('¶', '')
+    def fetch_page(self, url):
+        """the content of url with its cached cells, None if they have to be extracted"""
+        content = self.fetch(url, self.cache)
+        return content, self.cache.cells(url, content)
+
+    def fetch_content(self, url):
+        content, cells = self.fetch_page(url)
+        if cells is None:
+            cells = extract_cells(content)
+            self.cache.put(url, content, cells)
         return cells
 
 
-def fetch_all(sep=False):
-    content = requests.get('https://python3-cookbook.readthedocs.io/zh_CN/latest/').content
-    soup = BeautifulSoup(content)
-    for x in soup.find_all('a', class_='reference internal', href=re.compile('chapters/p\d+'))[2:15]:
-        ch = Chapter('https://python3-cookbook.readthedocs.io/zh_CN/latest/' + x['href'])
-        ch.fetch_list()
-        ch.fetch_sections(sep=sep)
+def markdown_cell(text):
+    return {"cell_type": "markdown", "metadata": {}, "source": [text.replace('¶', '')]}
+
+
+def code_cell(text):
+    return {"cell_type": "code", "execution_count": None, "metadata": {}, "outputs": [],
+            "source": [text.replace('¶', '')]}
+
+
+def pre_cells(text):
+    if '>>>' not in text:
+        # code
+        return [code_cell(P_BLANK_LINES.sub('', text))]
+    # idle
+    cells = []
+    source = []
+    for line in text.split('\n'):
+        if P_PROMPT.search(line):
+            if P_EMPTY_PROMPT.search(line):
+                continue
+            source.append(P_PROMPT_SPACE.sub('', line))
+        elif source:
+            cells.append(code_cell(P_BLANK_LINES.sub('', '\n'.join(source))))
+            source = []
+    if source:
+        cells.append(code_cell('\n'.join(source)))
+    return cells
+
+
+class CellParser(HTMLParser):
+    """
+    Turns the headers, paragraphs and <pre> blocks of a page into notebook
+    cells in a single pass, without building a tree: the text of every tag
+    still open is collected, and its cells take the place of its start tag,
+    so nested ones come out in document order as with soup.descendants.
+    End tags close the innermost open tag of that name and everything
+    opened inside it, like BeautifulSoup does.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.slots = []
+        self.stack = []  # [tag, slot or None, text pieces or None]
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+        if tag == 'p' or tag == 'pre' or P_HEADER.match(tag):
+            self.slots.append(None)
+            self.stack.append((tag, len(self.slots) - 1, []))
+        else:
+            self.stack.append((tag, None, None))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                break
+        else:
+            return
+        while len(self.stack) > i:
+            self._close(*self.stack.pop())
+
+    def handle_data(self, data):
+        if self.stack and self.stack[-1][0] in ('script', 'style', 'template'):
+            return  # not part of the text, as in bs4
+        for _, slot, text in self.stack:
+            if text is not None:
+                text.append(data)
+
+    def _close(self, tag, slot, text):
+        if slot is None:
+            return
+        text = ''.join(text)
+        if tag == 'pre':
+            self.slots[slot] = pre_cells(text)
+        elif tag == 'p':
+            self.slots[slot] = [] if 'Copyright' in text else [markdown_cell(text)]
+        else:
+            level = int(P_HEADER.match(tag).group('level'))
+            self.slots[slot] = [markdown_cell('{} {}\n'.format('#' * (level + 1), text))]
+
+    def cells(self):
+        self.close()
+        while self.stack:
+            self._close(*self.stack.pop())
+        return [cell for slot in self.slots for cell in slot]
+
+
+def extract_cells(content):
+    parser = CellParser()
+    parser.feed(content)
+    return parser.cells()
+
+
+class RstChapter(Chapter):
+    """a chapter read from the Sphinx sources, sections listed by its toctree"""
+
+    def fetch_list(self):
+        super().fetch_list()
+        path = local_path(self.chapter_address)
+        toctree = P_TOCTREE.search(path.read_text(encoding='utf-8'))
+        self.sections = []
+        for entry in toctree.group(1).split('\n') if toctree else []:
+            entry = entry.strip()
+            if not entry or entry.startswith(':'):
+                continue
+            # entries are relative to the chapter without the suffix, :glob: ones sorted like Sphinx does
+            for section in sorted(glob.glob(os.path.join(str(path.parent), entry + '.rst'))):
+                href = Path(os.path.relpath(section, str(path.parent))).as_posix()
+                if href not in self.sections:
+                    self.sections.append(href)
+
+
+def chapter_hrefs(fetcher, base):
+    root = local_path(base)
+    if root and (root / 'conf.py').exists():
+        # the source directory, one .rst per chapter
+        return [p.relative_to(root).as_posix() for p in sorted(root.glob('chapters/p*.rst'))
+                if P_CHAPTER.search(p.as_posix())]
+    soup = BeautifulSoup(fetcher.get(base), 'html.parser')
+    hrefs = []
+    for x in soup.find_all('a', class_='reference internal', href=P_CHAPTER):
+        # the sidebar links the chapters too
+        if x['href'] not in hrefs:
+            hrefs.append(x['href'])
+    return hrefs
+
+
+class Stage:
+    """pages that went through a pipeline stage, and how fast"""
+
+    def __init__(self, name, workers, noun=('thread', 'threads')):
+        self.name = name
+        self.workers = workers
+        # what a worker is called in the report, singular and plural
+        self.noun = noun
+        self.pages = 0
+        self.size = 0
+        self.busy = 0.0
+        self.first = None
+        self.last = None
+        self._lock = threading.Lock()
+
+    def done(self, start, size=0):
+        end = time.perf_counter()
+        with self._lock:
+            self.pages += 1
+            self.size += size
+            self.busy += end - start
+            self.first = start if self.first is None else min(self.first, start)
+            self.last = end if self.last is None else max(self.last, end)
+
+    def __str__(self):
+        elapsed = self.last - self.first if self.pages else 0.0
+        return '{:<5} {:5d} pages {:7.1f}M chars {:7.2f}s {:7.1f} pages/s  busy {:3.0f}% of {} {}'.format(
+            self.name, self.pages, self.size / 2 ** 20, elapsed, self.pages / elapsed if elapsed else 0.0,
+            100 * self.busy / (elapsed * self.workers) if elapsed else 0.0, self.workers,
+            self.noun[self.workers != 1])
+
+
+class Pipeline:
+    """
+    Exports the sections of chapters in three stages connected by bounded
+    queues, so downloading, parsing and writing overlap:
+
+        fetch   worker threads download the pages, cached cells skip parsing
+        parse   extract_cells() runs in a process pool, it is CPU-bound
+        write   one thread writes the section notebooks, and the chapter
+                notebook once all its sections are in
+
+    A full queue blocks the stage feeding it, so a slow stage holds the
+    others back instead of piling pages up in memory. Each stage reports
+    its throughput once done.
+    """
+
+    def __init__(self, chapters, sep=False, workers=8, processes=None, queue_size=32):
+        self.chapters = chapters
+        self.sep = sep
+        self.workers = workers
+        self.processes = os.cpu_count() if processes is None else processes
+        self.parse_queue = queue.Queue(queue_size)
+        self.write_queue = queue.Queue(queue_size)
+        # without processes the parse stage extracts in a single thread
+        parse = Stage('parse', max(self.processes, 1),
+                      ('process', 'processes') if self.processes else ('thread', 'threads'))
+        self.stages = [Stage('fetch', workers), parse, Stage('write', 1)]
+        self.errors = []
+
+    def run(self):
+        # spawned, forking while the fetch threads hold locks is not safe
+        pool = ProcessPoolExecutor(self.processes, multiprocessing.get_context('spawn')) if self.processes else None
+        parsers = [threading.Thread(target=self._parse, args=(pool,)) for _ in range(max(self.processes, 1))]
+        writer = threading.Thread(target=self._write)
+        for thread in parsers + [writer]:
+            thread.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                jobs = [executor.submit(self._fetch, ch, i, href)
+                        for ch in self.chapters for i, href in enumerate(ch.sections)]
+            for job in jobs:
+                job.result()
+        finally:
+            # the stages after a failed one keep draining their queue, so these get through
+            for _ in parsers:
+                self.parse_queue.put(None)
+            for thread in parsers:
+                thread.join()
+            self.write_queue.put(None)
+            writer.join()
+            if pool is not None:
+                pool.shutdown()
+        if self.errors:
+            raise self.errors[0]
+        for stage in self.stages:
+            print(stage)
+
+    def _fetch(self, ch, i, href):
+        if self.errors:
+            return
+        start = time.perf_counter()
+        url = ch.path + href
+        content, cells = ch.fetch_page(url)
+        self.stages[0].done(start, len(content or ''))
+        if cells is None:
+            self.parse_queue.put((ch, i, href, url, content))
+        else:
+            self.write_queue.put((ch, i, href, cells))
+
+    def _parse(self, pool):
+        while True:
+            item = self.parse_queue.get()
+            if item is None:
+                return
+            if self.errors:
+                continue
+            ch, i, href, url, content = item
+            start = time.perf_counter()
+            try:
+                cells = pool.submit(extract_cells, content).result() if pool else extract_cells(content)
+                ch.cache.put(url, content, cells)
+            except Exception as e:
+                self.errors.append(e)
+                continue
+            self.stages[1].done(start, len(content))
+            self.write_queue.put((ch, i, href, cells))
+
+    def _write(self):
+        sections = {ch: [None] * len(ch.sections) for ch in self.chapters}
+        left = {ch: len(ch.sections) for ch in self.chapters}
+        try:
+            for ch in self.chapters:
+                if not ch.sections:
+                    ch.write_chapter([])
+        except Exception as e:
+            self.errors.append(e)
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                return
+            if self.errors:
+                continue
+            ch, i, href, cells = item
+            start = time.perf_counter()
+            try:
+                if self.sep:
+                    ch.write_section(href, cells)
+                sections[ch][i] = cells
+                left[ch] -= 1
+                if not left[ch]:
+                    ch.write_chapter(sections.pop(ch))
+            except Exception as e:
+                self.errors.append(e)
+                continue
+            self.stages[2].done(start)
+
+
+def fetch_all(sep=False, base=BASE, workers=8, per_host=4, cache=CACHE, refresh=False, processes=None):
+    fetcher = Fetcher(per_host)
+    cache = PageCache(cache, refresh)
+    writer = NotebookWriter()
+    base = local_base(base)
+    hrefs = chapter_hrefs(fetcher, base)
+    try:
+        chapters = [(RstChapter if href.endswith('.rst') else Chapter)(urljoin(base, href), fetcher, None,
+                                                                       cache, writer)
+                    for href in hrefs]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(methodcaller('fetch_list'), chapters))
+        Pipeline(chapters, sep, workers, processes).run()
+    finally:
+        # whatever got done is not fetched again next time
+        cache.save()
 
 
 if __name__ == '__main__':
     # ch = Chapter('https://python3-cookbook.readthedocs.io/zh_CN/latest/chapters/p01_data_structures_algorithms.html')
     # ch.fetch_list()
     # ch.fetch_sections()
-    fetch_all(sep=True)
+    parser = argparse.ArgumentParser(description='export the cookbook as jupyter notebooks')
+    parser.add_argument('--base', default=BASE, help='root url of the html docs, or a local html or source directory')
+    parser.add_argument('--workers', type=int, default=8, help='pages downloaded at the same time')
+    parser.add_argument('--per-host', type=int, default=4, help='requests in flight to the same host')
+    parser.add_argument('--processes', type=int, help='processes parsing pages, 0 to parse in a thread')
+    parser.add_argument('--refresh', action='store_true', help='ignore what was cached by the last runs')
+    args = parser.parse_args()
+    fetch_all(sep=True, base=args.base, workers=args.workers, per_host=args.per_host, refresh=args.refresh,
+              processes=args.processes)